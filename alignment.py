@@ -0,0 +1,72 @@
+#! /usr/bin/env python3
+
+import numpy as np
+
+GAP = ord("-")
+
+# Lookup table mapping every byte to its ASCII upper-case form
+UPPER = np.arange(256, dtype=np.uint8)
+UPPER[ord("a") : ord("z") + 1] -= 32
+
+
+class Alignment:
+    """
+    Taxon labels and a 2-D ``uint8`` matrix with one row per taxon. Rows
+    are sorted by label, upper-cased and already padded or truncated to
+    ``nchar``, so each of them can be written out with ``tobytes()``.
+    """
+
+    def __init__(self, labels, matrix):
+        assert matrix.ndim == 2 and matrix.shape[0] == len(labels)
+        self.labels = labels
+        self.matrix = matrix
+
+    @property
+    def ntax(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nchar(self):
+        return self.matrix.shape[1]
+
+    def rows(self):
+        return zip(self.labels, self.matrix)
+
+    @classmethod
+    def from_sequences(cls, seqs, insert_gap_at=None):
+        """
+        Build the alignment from a ``{label: sequence}`` dict.
+
+        If ``insert_gap_at`` is given, shorter sequences are padded with
+        ``-`` at that index to the length of the longest sequence, the
+        index being interpreted like a Python slice bound. Otherwise all
+        sequences are truncated to the length of the shortest one.
+        """
+        labels = list(seqs)
+        data = [
+            s.encode("utf-8") if isinstance(s, str) else bytes(s) for s in seqs.values()
+        ]
+        lengths = np.fromiter((len(s) for s in data), dtype=np.int64, count=len(data))
+
+        if insert_gap_at is not None:
+            nchar = int(lengths.max())
+            # Gap position of each row, clamped like seq[:insert_gap_at]
+            gap_at = insert_gap_at if insert_gap_at >= 0 else lengths + insert_gap_at
+            gap_at = np.clip(gap_at, 0, lengths)[:, None]
+            gap_end = gap_at + (nchar - lengths)[:, None]
+            columns = np.arange(nchar)
+            keep = (columns < gap_at) | (columns >= gap_end)
+            matrix = np.full((len(data), nchar), GAP, dtype=np.uint8)
+            # Row-major order of the kept cells matches the order of the concatenated sequences
+            matrix[keep] = np.frombuffer(b"".join(data), dtype=np.uint8)
+        else:
+            # Only the first nchar residues of every row are ever copied
+            nchar = int(lengths.min())
+            matrix = np.empty((len(data), nchar), dtype=np.uint8)
+            for row, s in zip(matrix, data):
+                row[:] = np.frombuffer(s, dtype=np.uint8, count=nchar)
+
+        matrix = UPPER[matrix]
+
+        order = np.argsort(np.array(labels), kind="stable")
+        return cls([labels[i] for i in order], matrix[order])
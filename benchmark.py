@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+from pathlib import Path
+import platform
+from random import Random
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import attr
+
+from samplefiles import sample_files, sample_tree_files
+
+HERE = Path(__file__).resolve().parent
+
+# Maps random bytes onto bases
+BASES = bytes(b"ACGT"[i & 3] for i in range(256))
+
+FREQS = ("0.1", "0.5", "0.9")
+STAGES = (
+    "subsamplefasta",
+    "fasta_to_nexus",
+    "txttofastaupdated",
+    "mbblock_maker",
+    "generatev2",
+    "parser",
+    "parser_native",
+)
+
+# Runs a command as the child of this small process and writes its exit status,
+# wall time and rusage to the file descriptor given as the first argument. A
+# child's peak RSS counts from the memory of the process it was forked from, so
+# forking the stages from the benchmark itself would inflate it.
+LAUNCHER = """
+import json, os, sys, time
+fd = int(sys.argv[1])
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.execvp(sys.argv[2], sys.argv[2:])
+_, status, usage = os.wait4(pid, 0)
+wall_time = time.perf_counter() - start
+result = [os.waitstatus_to_exitcode(status), wall_time, usage.ru_utime, usage.ru_stime, usage.ru_maxrss]
+os.write(fd, json.dumps(result).encode())
+"""
+
+MBBLOCK_ARGS = [
+    "--nst", "6",
+    "--rates", "invgamma",
+    "--ngammacat", "4",
+    "--brlenspr", "unconstrained:GammaDir(1.0,0.100,1.0,1.0)",
+    "--shapepr", "exp(1.0)",
+    "--statefreqpr", "dirichlet(1.0,1.0,1.0,1.0)",
+    "--revmatpr", "Dirichlet(1.0,1.0,1.0,1.0,1.0,1.0)",
+    "--ngen", "10000000",
+    "--samplefreq", "1000",
+    "--printfreq", "1000",
+    "--burninfrac", "0.1",
+    "--nchains", "4",
+    "--nruns", "2",
+]
+
+
+@attr.s
+class Measurement:
+    stage: str = attr.ib()
+    records: int = attr.ib()
+    length: int = attr.ib()
+    wall_time: float = attr.ib()
+    user_time: float = attr.ib()
+    system_time: float = attr.ib()
+    # Peak resident set size of the process, in KiB
+    max_rss: int = attr.ib()
+    returncode: int = attr.ib()
+
+
+def write_clone_fasta(path: Path, records, length, rng: Random):
+    with open(path, "wb", buffering=1 << 20) as f:
+        for i in range(records):
+            f.write(b">clone_%d\n" % i)
+            f.write(rng.randbytes(length).translate(BASES))
+            f.write(b"\n")
+
+
+# The same records as a tab-delimited table with a header line, the input of txttofastaupdated.py
+def write_clone_table(path: Path, records, length, rng: Random):
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(b"name\tsequence\n")
+        for i in range(records):
+            f.write(b"clone_%d\t" % i)
+            f.write(rng.randbytes(length).translate(BASES))
+            f.write(b"\n")
+
+
+# Random unrooted binary topology on taxa 1..ntax, built by stepwise addition
+def random_newick(ntax, rng: Random) -> str:
+    subtrees = [str(i) for i in range(1, ntax + 1)]
+    while len(subtrees) > 3:
+        a = subtrees.pop(rng.randrange(len(subtrees)))
+        b = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append(f"({a}:0.1,{b}:0.1)")
+    return "(" + ",".join(f"{s}:0.1" for s in subtrees) + ");"
+
+
+def write_tree_file(path: Path, ntax, ntrees, rng: Random, samplefreq=1000):
+    with open(path, "w", buffering=1 << 20) as f:
+        f.write("#NEXUS\n[ID: 0]\nbegin trees;\n   translate\n")
+        f.write(
+            ",\n".join(f"      {i} taxon_{i}" for i in range(1, ntax + 1)) + ";\n"
+        )
+        for n in range(ntrees):
+            f.write(f"   tree gen.{n * samplefreq} = [&U] {random_newick(ntax, rng)}\n")
+        f.write("end;\n")
+
+
+# A table in the layout galax prints, for the given tree file names
+def write_galax_table(path: Path, tree_files, rng: Random):
+    names = list(tree_files) + ["merged"]
+    width = max(len("treefile"), *(len(n) for n in names))
+    columns = ["unique", "coverage", "H", "H*", "I", "Ipct", "D", "Dpct"]
+    lines = ["galax", "", f"{'treefile':>{width}}" + "".join(f"{c:>12}" for c in columns)]
+    for name in names:
+        values = [rng.randrange(1, 1000)] + [rng.random() * 10 for _ in columns[1:]]
+        lines.append(
+            f"{name:>{width}}{values[0]:>12}" + "".join(f"{v:>12.5f}" for v in values[1:])
+        )
+    path.write_text("\n".join(lines) + "\n\n", encoding="utf-8")
+
+
+def measure(stage, command, cwd: Path, records, length, log) -> Measurement:
+    """Run one stage through the launcher and take its time and peak RSS from wait4."""
+    read_fd, write_fd = os.pipe()
+    try:
+        subprocess.run(
+            [sys.executable, "-I", "-c", LAUNCHER, str(write_fd)] + command,
+            cwd=str(cwd),
+            stdout=log,
+            stderr=log,
+            pass_fds=(write_fd,),
+            check=True,
+        )
+        os.close(write_fd)
+        write_fd = None
+        with os.fdopen(read_fd, "rb") as result:
+            read_fd = None
+            returncode, wall_time, user_time, system_time, max_rss = json.loads(
+                result.read()
+            )
+    finally:
+        for fd in (read_fd, write_fd):
+            if fd is not None:
+                os.close(fd)
+    return Measurement(
+        stage=stage,
+        records=records,
+        length=length,
+        wall_time=wall_time,
+        user_time=user_time,
+        system_time=system_time,
+        max_rss=max_rss,
+        returncode=returncode,
+    )
+
+
+def script(name) -> List[str]:
+    return [sys.executable, str(HERE / name)]
+
+
+def prepare_data(workdir: Path, records, length, seed):
+    """Write the synthetic clone files every stage of one scale reads."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    rng = Random(seed)
+    write_clone_fasta(workdir / "clone.fasta", records, length, rng)
+    write_clone_table(workdir / "clone.txt", records, length, rng)
+    # generatev2 samples from one file per frequency and clone
+    for clone in ("same", "diff"):
+        (workdir / clone).mkdir(exist_ok=True)
+        for freq in FREQS:
+            os.link(workdir / "clone.fasta", workdir / clone / f"freq{freq}.fasta")
+
+
+# Writes galax tables and .t files into every generated run folder, as if mb and galax had run
+def fake_mcmc_outputs(generated: Path, ntrees, seed):
+    rng = Random(seed)
+    for parameters_json in sorted(generated.rglob("parameters.json")):
+        meta = json.loads(parameters_json.read_text(encoding="utf-8"))
+        _, nexus_files = sample_files(meta)
+        ntax = 7 if meta["origin.is_combined"] else 6
+        for index in range(1, len(nexus_files) + 1):
+            tree_files = sample_tree_files(meta, index)
+            for t in tree_files:
+                write_tree_file(parameters_json.parent / t, ntax, ntrees, rng)
+            write_galax_table(
+                parameters_json.parent / f"samp{index}merged.txt", tree_files, rng
+            )
+
+
+def run_scale(workdir: Path, records, length, stages, iterations, ntrees, seed, log):
+    prepare_data(workdir, records, length, seed)
+    commands = {
+        "subsamplefasta": script("subsamplefasta.py")
+        + [
+            "--inFile", "clone.fasta",
+            "--outFile", "samp",
+            "--number", "6",
+            "--iterations", str(iterations),
+            "--index",
+            "--seed", str(seed),
+        ],
+        "fasta_to_nexus": script("fasta_to_nexus.py") + ["--inFile", "clone.fasta"],
+        "txttofastaupdated": script("txttofastaupdated.py")
+        + [
+            "--infile", "clone.txt",
+            "--outfile", "clone_txt.fasta",
+            "--delimiter", "\t",
+            "--skip-header",
+        ],
+        "mbblock_maker": script("mbblock_maker.py")
+        + ["--inpath"]
+        + [f"samp_{i}.nexus" for i in range(1, iterations + 1)]
+        + MBBLOCK_ARGS
+        + ["--outfile", "mbblock"],
+        "generatev2": script("generatev2.py")
+        + [
+            "--output", "generated",
+            "--number", str(iterations),
+            "--sample-seed", str(seed),
+            "--sameclonedata", "same", "",
+            "--diffclonedata", "diff", "",
+        ],
+        "parser": script("parser.py") + ["generated", "--output", "parsed.csv"],
+        "parser_native": script("parser.py")
+        + ["generated", "--native", "--output", "parsed_native.csv"],
+    }
+    results = []
+    for stage in stages:
+        if stage.startswith("parser") and not (workdir / "generated").exists():
+            print(f"Skipping {stage}, it needs the output of generatev2.")
+            continue
+        if stage == "parser" or stage == "parser_native":
+            if not (workdir / "generated" / ".fake_outputs").exists():
+                fake_mcmc_outputs(workdir / "generated", ntrees, seed)
+                (workdir / "generated" / ".fake_outputs").touch()
+        result = measure(stage, commands[stage], workdir, records, length, log)
+        print(
+            f"{stage:>18} {records:>9} x {length:<7} {result.wall_time:9.3f} s "
+            f"{result.max_rss / 1024:9.1f} MiB"
+            + ("" if result.returncode == 0 else f"  FAILED ({result.returncode})")
+        )
+        results.append(result)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=str(HERE),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Prints the wall time and peak RSS of each result relative to the same stage and scale in an earlier report
+def compare(results, baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    earlier = {
+        (r["stage"], r["records"], r["length"]): r for r in baseline["results"]
+    }
+    print(f"Compared with {baseline_path} (commit {baseline.get('commit')}):")
+    for result in results:
+        before = earlier.get((result.stage, result.records, result.length))
+        if before is None or before["wall_time"] == 0 or before["max_rss"] == 0:
+            continue
+        print(
+            f"{result.stage:>18} {result.records:>9} x {result.length:<7} "
+            f"time x{result.wall_time / before['wall_time']:.2f} "
+            f"RSS x{result.max_rss / before['max_rss']:.2f}"
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Time every pipeline stage on synthetic clone data and record its peak RSS."
+    )
+    ap.add_argument(
+        "--scale",
+        nargs=2,
+        type=int,
+        action="append",
+        metavar=("RECORDS", "LENGTH"),
+        help="Number of records per clone file and their length in bp. Can be given several times. Defaults to 1000 1000.",
+    )
+    ap.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=list(STAGES),
+        help="Stages to benchmark, in this order.",
+    )
+    ap.add_argument(
+        "--iterations",
+        type=int,
+        default=10,
+        help="Samples drawn per file by subsamplefasta and generatev2.",
+    )
+    ap.add_argument(
+        "--trees", type=int, default=1000, help="Trees per synthetic .t file."
+    )
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument(
+        "--workdir",
+        type=Path,
+        default=Path("benchmark_data"),
+        help="Directory the synthetic data and stage outputs are written to. Must not exist yet.",
+    )
+    ap.add_argument(
+        "--output",
+        "-o",
+        type=Path,
+        default=Path("benchmark.json"),
+        help="JSON file receiving the results.",
+    )
+    ap.add_argument(
+        "--baseline",
+        type=Path,
+        help="Earlier benchmark JSON to compare the results with.",
+    )
+    A = ap.parse_args()
+
+    scales = A.scale or [(1000, 1000)]
+    A.workdir.mkdir(parents=True)
+    results = []
+    with open(A.workdir / "benchmark.log", "w") as log:
+        for records, length in scales:
+            results.extend(
+                run_scale(
+                    A.workdir.resolve() / f"{records}x{length}",
+                    records,
+                    length,
+                    A.stages,
+                    A.iterations,
+                    A.trees,
+                    A.seed,
+                    log,
+                )
+            )
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "iterations": A.iterations,
+        "trees": A.trees,
+        "results": [attr.asdict(r) for r in results],
+    }
+    A.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {A.output}.")
+    if A.baseline is not None:
+        compare(results, A.baseline)
+    if any(r.returncode != 0 for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import Counter, defaultdict
+from math import exp, log
+import re
+from typing import Dict, List
+
+import attr
+
+# The metrics below are estimates from the conditional clade distribution of
+# the sampled trees. They follow galax' table layout and definitions, and match
+# a reference table worked out by hand for 4 taxa, where the CCD is exact. They
+# have not been compared with tables galax printed, so they must not be mixed
+# with galax output.
+ESTIMATOR = "bipartitions CCD estimate"
+
+# Comments, branch lengths, punctuation and labels of a Newick string
+NEWICK_TOKEN = re.compile(r"\[[^\]]*\]|:[^,();\[]*|[(),;]|[^\s(),:;\[\]]+")
+
+
+@attr.s
+class InformationRow:
+    treefile: str = attr.ib()
+    unique: int = attr.ib()
+    coverage: float = attr.ib()
+    H: float = attr.ib()
+    Hstar: float = attr.ib()
+    I: float = attr.ib()
+    Ipct: float = attr.ib()
+    D: float = attr.ib()
+    Dpct: float = attr.ib()
+
+
+# Column names in galax' order
+COLUMNS = ["treefile", "unique", "coverage", "H", "H*", "I", "Ipct", "D", "Dpct"]
+
+
+@attr.s
+class TreeSample:
+    """Conditional clade counts of the trees kept from one or more tree files."""
+
+    ntax: int = attr.ib(default=0)
+    # Number of trees containing each clade (as a taxon bitset)
+    clades: Counter = attr.ib(factory=Counter)
+    # Number of trees splitting a clade into a given tuple of child clades
+    splits: Counter = attr.ib(factory=Counter)
+    # Number of trees per distinct topology, and the splits of each topology
+    topologies: Counter = attr.ib(factory=Counter)
+    topology_splits: Dict[frozenset, tuple] = attr.ib(factory=dict)
+
+    def add(self, tree_splits):
+        topology = frozenset(tree_splits)
+        self.topologies[topology] += 1
+        self.topology_splits.setdefault(topology, tree_splits)
+        self.splits.update(tree_splits)
+        self.clades.update(clade for clade, _ in tree_splits)
+
+    def merge(self, other):
+        self.ntax = max(self.ntax, other.ntax)
+        self.clades.update(other.clades)
+        self.splits.update(other.splits)
+        self.topologies.update(other.topologies)
+        for topology, tree_splits in other.topology_splits.items():
+            self.topology_splits.setdefault(topology, tree_splits)
+
+
+def parse_newick(newick, taxon_bits):
+    """
+    Parse a Newick string into an adjacency list. Returns the adjacency
+    list and the taxon bit of every node (0 for internal nodes). Branch
+    lengths, comments and internal node labels are ignored.
+    """
+    adjacency = []
+    bits = []
+    stack = []
+    previous = None
+
+    def add_node(bit):
+        adjacency.append([])
+        bits.append(bit)
+        node = len(adjacency) - 1
+        if stack:
+            adjacency[node].append(stack[-1])
+            adjacency[stack[-1]].append(node)
+        return node
+
+    for token in NEWICK_TOKEN.findall(newick):
+        first = token[0]
+        if first in ":[;":
+            continue
+        if first == "(":
+            stack.append(add_node(0))
+        elif first == ")":
+            stack.pop()
+        elif first != "," and previous in ("(", ","):
+            add_node(taxon_bits.setdefault(token, 1 << len(taxon_bits)))
+        previous = first
+    return adjacency, bits
+
+
+def tree_splits(newick, taxon_bits) -> tuple:
+    """
+    Root the unrooted tree at its first taxon and return its conditional
+    splits as ``(clade, children)`` pairs, where ``clade`` is the bitset
+    of the taxa below an internal node and ``children`` the sorted
+    bitsets of its child clades.
+    """
+    adjacency, bits = parse_newick(newick, taxon_bits)
+    root = bits.index(1)
+    parent = {root: -1}
+    order = []
+    stack = [root]
+    while stack:
+        v = stack.pop()
+        order.append(v)
+        for w in adjacency[v]:
+            if w != parent[v]:
+                parent[w] = v
+                stack.append(w)
+
+    clade = [0] * len(adjacency)
+    splits = []
+    for v in reversed(order):
+        if v == root:
+            continue
+        children = [clade[w] for w in adjacency[v] if w != parent[v]]
+        if not children:
+            clade[v] = bits[v]
+            continue
+        clade[v] = sum(children)
+        splits.append((clade[v], tuple(sorted(children))))
+    return tuple(splits)
+
+
+# Give the taxa of one line of a translate block their bits; returns whether the block continues
+def add_translate_entries(line, taxon_bits) -> bool:
+    # Taxa get their bits in translate order, so the first taxon is bit 1
+    for entry in line.rstrip(";").split(","):
+        if entry.strip():
+            number = entry.split(None, 1)[0]
+            taxon_bits[number] = 1 << len(taxon_bits)
+    return not line.endswith(";")
+
+
+def read_tree_file(path, burninfrac=0.0) -> TreeSample:
+    """
+    Stream a MrBayes ``.t`` file and count the splits of the trees left
+    after discarding the first ``burninfrac`` of them.
+    """
+    with open(path, "r", encoding="utf-8") as t_file:
+        ntrees = sum(1 for line in t_file if line.lstrip().startswith("tree "))
+    burnin = int(ntrees * burninfrac)
+
+    sample = TreeSample()
+    taxon_bits = {}
+    in_translate = False
+    seen = 0
+    with open(path, "r", encoding="utf-8") as t_file:
+        for line in t_file:
+            stripped = line.strip()
+            if in_translate:
+                in_translate = add_translate_entries(stripped, taxon_bits)
+            elif stripped.lower() == "translate":
+                in_translate = True
+            elif stripped.startswith("tree "):
+                seen += 1
+                if seen <= burnin:
+                    continue
+                newick = stripped.split("=", 1)[1]
+                sample.add(tree_splits(newick, taxon_bits))
+    sample.ntax = len(taxon_bits)
+    return sample
+
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+
+def conditional_probabilities(sample: TreeSample):
+    return {
+        (clade, children): n / sample.clades[clade]
+        for (clade, children), n in sample.splits.items()
+    }
+
+
+def ccd_entropy(sample: TreeSample) -> float:
+    """Entropy of the conditional clade distribution estimated from the sample."""
+    probabilities = conditional_probabilities(sample)
+    by_clade = defaultdict(list)
+    for (clade, children), p in probabilities.items():
+        by_clade[clade].append((children, p))
+    entropy = {}
+    for clade in sorted(by_clade, key=_popcount):
+        entropy[clade] = sum(
+            p * (-log(p) + sum(entropy.get(child, 0.0) for child in children))
+            for children, p in by_clade[clade]
+        )
+    if not entropy:
+        return 0.0
+    root = max(entropy, key=_popcount)
+    return entropy[root]
+
+
+def max_entropy(ntax) -> float:
+    """log of the number of unrooted binary topologies, (2n - 5)!!."""
+    return sum(log(2 * k - 5) for k in range(4, ntax + 1))
+
+
+# Share of the conditional clade distribution taken up by the sampled topologies
+def coverage(sample: TreeSample) -> float:
+    probabilities = conditional_probabilities(sample)
+    return sum(
+        exp(sum(log(probabilities[split]) for split in tree_splits))
+        for tree_splits in sample.topology_splits.values()
+    )
+
+
+def information_row(name, sample: TreeSample, D=0.0) -> InformationRow:
+    H = ccd_entropy(sample)
+    Hstar = max_entropy(sample.ntax)
+    I = Hstar - H
+    return InformationRow(
+        treefile=name,
+        unique=len(sample.topologies),
+        coverage=coverage(sample),
+        H=H,
+        Hstar=Hstar,
+        I=I,
+        Ipct=100.0 * I / Hstar if Hstar > 0 else 0.0,
+        D=D,
+        Dpct=100.0 * D / Hstar if Hstar > 0 else 0.0,
+    )
+
+
+def information_table(tree_files, burninfrac=0.0) -> List[InformationRow]:
+    """
+    Compute one row per tree file plus a final ``merged`` row, laid out
+    like the table printed by galax. The values are this module's own
+    estimates, not galax-equivalent (see ``ESTIMATOR``).
+
+    ``unique`` is the number of distinct topologies kept after burn-in,
+    ``coverage`` the total probability the conditional clade
+    distribution (CCD) assigns to them, ``H`` the CCD entropy, ``H*`` the
+    entropy of the uniform distribution over unrooted topologies, and
+    ``I = H* - H``. The dissonance ``D`` of the merged row is its entropy
+    minus the mean entropy of the individual files. Percentages are
+    relative to ``H*``.
+    """
+    merged = TreeSample()
+    rows = []
+    for path in tree_files:
+        sample = read_tree_file(path, burninfrac)
+        rows.append(information_row(str(path), sample))
+        merged.merge(sample)
+    mean_H = sum(r.H for r in rows) / len(rows) if rows else 0.0
+    H_merged = ccd_entropy(merged)
+    rows.append(information_row("merged", merged, D=H_merged - mean_H))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("treefiles", help="MrBayes .t files to merge.", nargs="+")
+    ap.add_argument(
+        "--burninfrac",
+        type=float,
+        default=0.0,
+        help="Fraction of the trees of each file to discard as burn-in.",
+    )
+    A = ap.parse_args()
+
+    print(f"[{ESTIMATOR}; not galax output]")
+    print("  ".join(f"{c:>12}" for c in COLUMNS))
+    for row in information_table(A.treefiles, A.burninfrac):
+        print(
+            f"{row.treefile:>12}  {row.unique:>12}"
+            + "".join(f"  {v:>12.5f}" for v in attr.astuple(row)[2:])
+        )
+
+
+if __name__ == "__main__":
+    main()
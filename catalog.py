@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+
+import attr
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    parameters_path TEXT PRIMARY KEY,
+    origin_freq TEXT,
+    origin_prefix TEXT,
+    parameters TEXT NOT NULL,
+    input_hashes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_origin ON runs (origin_freq, origin_prefix);
+CREATE INDEX IF NOT EXISTS runs_prefix ON runs (origin_prefix);
+CREATE TABLE IF NOT EXISTS stages (
+    parameters_path TEXT NOT NULL REFERENCES runs (parameters_path) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_ns INTEGER NOT NULL,
+    PRIMARY KEY (parameters_path, stage)
+);
+CREATE INDEX IF NOT EXISTS stages_state ON stages (stage, state);
+"""
+
+# Default file name of the catalog in an experiment's output directory
+CATALOG_NAME = "catalog.sqlite"
+
+# Stages run.py records, in the order they run
+STAGES = ("prepare", "mb", "postprocess")
+DONE = "done"
+FAILED = "failed"
+
+
+@attr.s
+class RunRecord:
+    parameters_path: str = attr.ib()
+    meta: dict = attr.ib()
+    input_hashes: Dict[str, str] = attr.ib()
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Reads a run folder's parameters.json and hashes its input files, so workers can do it in parallel
+def run_record(parameters_json: Path) -> RunRecord:
+    parameters_json = Path(parameters_json).resolve()
+    meta = json.loads(parameters_json.read_text(encoding="utf-8"))
+    return RunRecord(
+        parameters_path=str(parameters_json),
+        meta=meta,
+        input_hashes={
+            name: file_sha256(parameters_json.parent / name) for name in meta["inputs"]
+        },
+    )
+
+
+class Catalog:
+    """
+    SQLite catalog of the run folders of an experiment, with one row per
+    folder keyed by the resolved path of its ``parameters.json``. Each
+    row holds the parameters and the SHA-256 of the input files, and the
+    ``stages`` table the outcome of every pipeline stage run on it, so
+    runs can be listed and filtered without walking the file system.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path), timeout=60)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, records: Iterable[RunRecord]):
+        """Insert or update runs. A run whose inputs changed loses its stage records."""
+        with self.db:
+            for record in records:
+                hashes = json.dumps(record.input_hashes, sort_keys=True)
+                self.db.execute(
+                    "DELETE FROM stages WHERE parameters_path = ? AND EXISTS"
+                    " (SELECT 1 FROM runs WHERE parameters_path = ? AND input_hashes != ?)",
+                    (record.parameters_path, record.parameters_path, hashes),
+                )
+                self.db.execute(
+                    "INSERT INTO runs VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (parameters_path) DO UPDATE SET"
+                    " origin_freq = excluded.origin_freq,"
+                    " origin_prefix = excluded.origin_prefix,"
+                    " parameters = excluded.parameters,"
+                    " input_hashes = excluded.input_hashes",
+                    (
+                        record.parameters_path,
+                        record.meta.get("origin.freq"),
+                        record.meta.get("origin.prefix"),
+                        json.dumps(record.meta),
+                        hashes,
+                    ),
+                )
+
+    def set_stage(self, parameters_path, stage, state):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?)",
+                (str(parameters_path), stage, state, time.time_ns()),
+            )
+
+    def parameter_files(self, freq=None, prefix=None, pending=None) -> List[Path]:
+        """
+        Return the cataloged ``parameters.json`` paths, optionally only
+        those of one origin.freq and/or origin.prefix, and with
+        ``pending`` only those where that stage has not succeeded yet.
+        """
+        conditions = []
+        values = []
+        if freq is not None:
+            conditions.append("origin_freq = ?")
+            values.append(freq)
+        if prefix is not None:
+            conditions.append("origin_prefix = ?")
+            values.append(prefix)
+        if pending is not None:
+            conditions.append(
+                "NOT EXISTS (SELECT 1 FROM stages WHERE stages.parameters_path ="
+                " runs.parameters_path AND stage = ? AND state = ?)"
+            )
+            values.extend([pending, DONE])
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.db.execute(
+            f"SELECT parameters_path FROM runs{where} ORDER BY parameters_path", values
+        )
+        return [Path(parameters_path) for (parameters_path,) in cursor]
+
+    # Number of runs per stage and state
+    def summary(self) -> List[tuple]:
+        return self.db.execute(
+            "SELECT stage, state, COUNT(*) FROM stages GROUP BY stage, state"
+            " ORDER BY stage, state"
+        ).fetchall()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List the runs of an experiment catalog.")
+    ap.add_argument("catalog", type=Path, help="Catalog database, e.g. OUTPUT/catalog.sqlite.")
+    ap.add_argument("--freq", help="Only list runs with this origin.freq.")
+    ap.add_argument("--prefix", help="Only list runs with this origin.prefix.")
+    ap.add_argument(
+        "--pending",
+        choices=STAGES,
+        help="Only list runs where this stage has not succeeded yet.",
+    )
+    A = ap.parse_args()
+
+    with Catalog(A.catalog) as catalog:
+        files = catalog.parameter_files(A.freq, A.prefix, A.pending)
+        for parameters_json in files:
+            print(parameters_json)
+        print(f"{len(files)} runs.")
+        for stage, state, count in catalog.summary():
+            print(f"{stage} {state}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used_ns);
+"""
+
+# ioctl that makes a file share another file's blocks copy-on-write (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+# Copies src to dst as a reflink where the file system supports it, and in full otherwise
+def clone_file(src, dst):
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+class ConversionCache:
+    """
+    Content-addressed store of conversion outputs shared by many MCMC
+    folders. An entry is keyed by the kind of conversion, its parameters
+    and the SHA-256 of the input file, and lives in
+    ``<root>/objects/<key[:2]>/<key>``. Entries are stored and hits
+    fetched as copies, reflinked where the file system can, never as
+    hardlinks: a converter rewriting a folder's output in place must not
+    reach the cache or the other folders. Once the entries exceed
+    ``max_bytes``, the least recently used ones are evicted.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(str(self.root / "index.sqlite"), timeout=60)
+        self.db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(kind, params, input_digest) -> str:
+        digest = hashlib.sha256(kind.encode("utf-8"))
+        digest.update(b"\0" + json.dumps(params, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0" + input_digest.encode("ascii"))
+        return digest.hexdigest()
+
+    def object_path(self, key) -> Path:
+        return self.objects / key[:2] / key
+
+    def fetch(self, key, dest: Path) -> bool:
+        """Copy the entry to ``dest``, replacing it. Returns False on a miss."""
+        tmp_path = dest.with_name(dest.name + f".{os.getpid()}.tmp")
+        try:
+            clone_file(self.object_path(key), tmp_path)
+        except FileNotFoundError:
+            Path(tmp_path).unlink(missing_ok=True)
+            self.misses += 1
+            return False
+        os.replace(tmp_path, dest)
+        with self.db:
+            self.db.execute(
+                "UPDATE entries SET last_used_ns = ? WHERE key = ?", (time.time_ns(), key)
+            )
+        self.hits += 1
+        return True
+
+    def store(self, key, src: Path):
+        path = self.object_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        clone_file(src, tmp_path)
+        os.replace(tmp_path, path)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, path.stat().st_size, time.time_ns()),
+            )
+        self.evict()
+
+    def size(self) -> int:
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self.db.execute(
+            "SELECT key, size FROM entries ORDER BY last_used_ns"
+        ):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        with self.db:
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in victims])
+        for key in victims:
+            try:
+                self.object_path(key).unlink()
+            except FileNotFoundError:
+                pass
+        self.evicted += len(victims)
+
+    def report(self) -> str:
+        return (
+            f"Conversion cache: {self.hits} hits, {self.misses} misses, "
+            f"{self.evicted} evicted, {self.size()} bytes in {self.root}."
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Show or trim a conversion cache.")
+    ap.add_argument("root", type=Path, help="Cache directory.")
+    ap.add_argument(
+        "--max-mib",
+        type=int,
+        help="Evict least recently used entries until the cache fits in this many MiB.",
+    )
+    A = ap.parse_args()
+
+    max_bytes = None if A.max_mib is None else A.max_mib << 20
+    with ConversionCache(A.root, max_bytes) as cache:
+        cache.evict()
+        count = cache.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        print(f"{count} entries, {cache.size()} bytes, {cache.evicted} evicted.")
+
+
+if __name__ == "__main__":
+    main()
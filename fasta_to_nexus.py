@@ -1,8 +1,19 @@
 #! /usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 import sys
+import time
+from typing import Optional
+
+import attr
+
+from alignment import GAP, UPPER, Alignment
+from fastaio import RecordCursor, iter_record_spans, iter_records, map_file, residue_count
+from packedfasta import PackedFasta, is_packed, write_packed
+import tracing
 
 
 def readArguments():
@@ -22,7 +33,39 @@ def readArguments():
         type=int,
         help="If the sequences don't have the same length, insert a gap at this index. If this option is absent, truncate the sequences that are shorter than the minimum sequence length",
     )
+    optional.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes converting files in parallel. Default = 1",
+    )
+    optional.add_argument(
+        "--write-packed",
+        action="store_true",
+        help="Also write the converted alignment as a 2-bit packed file (<name>.aln.pfa) next to the NEXUS file.",
+    )
+    optional.add_argument(
+        "--interleave",
+        type=int,
+        metavar="WIDTH",
+        help="Write an interleaved matrix in blocks of WIDTH columns, streaming each block from the input instead of loading whole sequences. Cannot be combined with --write-packed.",
+    )
+    optional.add_argument(
+        "--char-map",
+        nargs="+",
+        metavar="FROM=TO",
+        help="Replace residue character FROM by TO while converting, in the same pass as writing the NEXUS file (what charconverter.py does as a separate step). Cannot be combined with --write-packed.",
+    )
     args = parser.parse_args()
+    if args.interleave is not None and args.interleave < 1:
+        parser.error("--interleave needs a positive WIDTH")
+    if args.interleave is not None and args.write_packed:
+        parser.error("--interleave cannot be combined with --write-packed")
+    if args.char_map is not None and args.write_packed:
+        parser.error("--char-map cannot be combined with --write-packed")
+    if args.char_map is not None and not all("=" in pair for pair in args.char_map):
+        parser.error("--char-map takes FROM=TO pairs")
     return args
 
 
@@ -32,72 +75,286 @@ class ArgumentParser(argparse.ArgumentParser):
         self.exit(2, "%s: error: %s\n" % (self.prog, message))
 
 
-# Parse fasta file
+# Parse fasta file, or a packed file written by packedfasta.py
 def prepinfile(infile):
-    with open(infile, "r", encoding="utf-8") as fasta:
-        seqs = {}
-        order_seq = None
-        lines = fasta.readlines()
-        for i in lines:
-            i = i.replace("\n", "").replace("\r", "")
-            if i:
-                if i.startswith(">"):
-                    label = i[1:]
-                    seqs[label] = []
-                    order_seq = seqs[label]
-                else:
-                    if order_seq is None:
-                        raise Exception("Sequence data found before label")
-                    order_seq.extend(i.replace(" ", ""))
-    return seqs
+    if is_packed(infile):
+        with PackedFasta(infile) as packed:
+            return {label: seq.decode("utf-8") for label, seq in packed}
+    with map_file(infile) as buf:
+        return {
+            label: seq.decode("utf-8") for label, seq in iter_records(buf)
+        }
 
 
 # Convert into nexus
-def genNexus(outfile, seqs, insert_gap_at):
-    with open(outfile, "w+", encoding="utf-8") as nexus:
-        nexus.write("#NEXUS\n")
-
-        # Sets the value of nchar depending on the value of the argument insert_gap_as
-        if insert_gap_at is not None:
-            nchar = max(len(s) for s in seqs.values())
-        else:
-            nchar = min(len(s) for s in seqs.values())
-
-        nexus.write("begin data;\n")
-        nexus.write(f"dimensions ntax={len(seqs)} nchar={nchar};\n")
-        nexus.write("format datatype=dna missing=? gap=-;\n")
-        nexus.write("matrix\n")
-        for taxlabel, seq in sorted(seqs.items()):
-            seq_string = "".join(seq).upper()
-            if len(seq_string) != nchar:
-                # Add gap characters if requested by user
-                if insert_gap_at is not None:
-                    seq_string = (
-                        seq_string[:insert_gap_at]
-                        + "-" * (nchar - len(seq_string))
-                        + seq_string[insert_gap_at:]
-                    )
-                else:
-                    # Truncate
-                    seq_string = seq_string[:nchar]
-            nexus.write(f"{taxlabel} {seq_string}\n")
-        nexus.write("\t;\n")
-        nexus.write("end;\n")
+def genNexus(outfile, seqs, insert_gap_at, packed_outfile=None):
+    # Upper-casing, sorting and padding or truncation happen on the whole matrix at once
+    aln = Alignment.from_sequences(seqs, insert_gap_at)
+    if packed_outfile is not None:
+        write_packed(packed_outfile, ((label, row.tobytes()) for label, row in aln.rows()))
+    with open(outfile, "wb") as nexus:
+        nexus.write(b"#NEXUS\n")
+        nexus.write(b"begin data;\n")
+        nexus.write(f"dimensions ntax={aln.ntax} nchar={aln.nchar};\n".encode("utf-8"))
+        nexus.write(b"format datatype=dna missing=? gap=-;\n")
+        nexus.write(b"matrix\n")
+        for taxlabel, row in aln.rows():
+            nexus.write(taxlabel.encode("utf-8") + b" " + row.tobytes() + b"\n")
+        nexus.write(b"\t;\n")
+        nexus.write(b"end;\n")
     return
 
 
+# Upper-cases bytes like alignment.UPPER
+UPPER_TABLE = UPPER.tobytes()
+
+
+class PaddedRow:
+    """
+    One taxon's row of the converted matrix, read window by window from
+    a cursor over its residues. ``nchar - length`` gaps are inserted at
+    ``gap_at`` (for padding) or the row simply ends at ``nchar`` (for
+    truncation), without the whole row ever being built.
+    """
+
+    def __init__(self, cursor, length, nchar, gap_at):
+        self.cursor = cursor
+        self.gap_at = gap_at
+        self.gap_end = gap_at + max(0, nchar - length)
+
+    def window(self, start, stop) -> bytes:
+        head = max(0, min(stop, self.gap_at) - start)
+        gaps = max(0, min(stop, self.gap_end) - max(start, self.gap_at))
+        tail = max(0, stop - max(start, self.gap_end))
+        data = self.cursor.read(head) + bytes([GAP]) * gaps + self.cursor.read(tail)
+        return data.translate(UPPER_TABLE)
+
+
+# (label, cursor, length) of every record; with duplicate labels the last record wins, as in prepinfile
+def record_cursors(buf, table=None):
+    records = {}
+    for label, start, end in iter_record_spans(buf):
+        records[label] = (
+            RecordCursor(buf, start, end, table),
+            residue_count(buf, start, end),
+        )
+    return [(label, cursor, length) for label, (cursor, length) in records.items()]
+
+
+# Packed rows are decoded whole, so only FASTA input is streamed
+def packed_cursors(packed):
+    records = {label: seq for label, seq in packed}
+    return [
+        (label, RecordCursor(seq, 0, len(seq)), len(seq))
+        for label, seq in records.items()
+    ]
+
+
+def genNexusInterleaved(outfile, records, insert_gap_at, width):
+    """
+    Write the same alignment as ``genNexus`` as an interleaved matrix of
+    ``width`` column blocks, from ``(label, cursor, length)`` records.
+    Only one block of every row is held in memory.
+    """
+    if not records:
+        raise ValueError("No sequences to convert.")
+    lengths = [length for _, _, length in records]
+    rows = []
+    if insert_gap_at is not None:
+        nchar = max(lengths)
+        for label, cursor, length in records:
+            # Gap position of each row, clamped like seq[:insert_gap_at]
+            gap_at = insert_gap_at if insert_gap_at >= 0 else length + insert_gap_at
+            gap_at = min(max(gap_at, 0), length)
+            rows.append((label, PaddedRow(cursor, length, nchar, gap_at)))
+    else:
+        nchar = min(lengths)
+        rows = [
+            (label, PaddedRow(cursor, length, nchar, nchar))
+            for label, cursor, length in records
+        ]
+    rows.sort(key=lambda row: row[0])
+
+    with open(outfile, "wb") as nexus:
+        nexus.write(b"#NEXUS\n")
+        nexus.write(b"begin data;\n")
+        nexus.write(f"dimensions ntax={len(rows)} nchar={nchar};\n".encode("utf-8"))
+        nexus.write(b"format datatype=dna missing=? gap=- interleave=yes;\n")
+        nexus.write(b"matrix\n")
+        labels = [label.encode("utf-8") + b" " for label, _ in rows]
+        # An empty matrix still lists every taxon once
+        for start in range(0, nchar, width) if nchar else [0]:
+            if start > 0:
+                nexus.write(b"\n")
+            stop = min(start + width, nchar)
+            for label, (_, row) in zip(labels, rows):
+                nexus.write(label + row.window(start, stop) + b"\n")
+        nexus.write(b"\t;\n")
+        nexus.write(b"end;\n")
+
+
+@attr.s
+class ConversionResult:
+    path: str = attr.ib()
+    nbytes: int = attr.ib(default=0)
+    error: Optional[str] = attr.ib(default=None)
+
+
+# Converts a single FASTA file next to itself; failures are reported in the result instead of raised
+def convert_file(f, insert_gap_at, packed=False, interleave=None):
+    f = Path(f)
+    try:
+        if interleave is not None:
+            with tracing.span("fasta_to_nexus interleaved", file=str(f)):
+                convert_file_interleaved(f, insert_gap_at, interleave)
+            return ConversionResult(path=str(f), nbytes=f.stat().st_size)
+        with tracing.span("fasta_to_nexus", file=str(f)):
+            with tracing.span("read fasta", file=str(f)):
+                seqs = prepinfile(f)
+            packed_outfile = f.with_suffix(".aln.pfa") if packed else None
+            with tracing.span("write nexus", file=str(f)):
+                genNexus(f.with_suffix(".nexus"), seqs, insert_gap_at, packed_outfile)
+        return ConversionResult(path=str(f), nbytes=f.stat().st_size)
+    except Exception as e:
+        return ConversionResult(path=str(f), error=f"{type(e).__name__}: {e}")
+
+
+def convert_file_interleaved(f: Path, insert_gap_at, width):
+    if is_packed(f):
+        with PackedFasta(f) as packed:
+            records = packed_cursors(packed)
+            genNexusInterleaved(f.with_suffix(".nexus"), records, insert_gap_at, width)
+        return
+    with map_file(f) as buf:
+        records = record_cursors(buf)
+        genNexusInterleaved(f.with_suffix(".nexus"), records, insert_gap_at, width)
+
+
+# bytes.translate table replacing residue characters like charconverter.py, from a {"from": "to"} mapping
+def char_table(mapping) -> bytes:
+    for source, target in mapping.items():
+        if len(source) != 1 or len(target) != 1:
+            raise ValueError(
+                f"Character mapping {source!r}: {target!r} does not map one character to one"
+            )
+    return bytes.maketrans(
+        "".join(mapping).encode("ascii"), "".join(mapping.values()).encode("ascii")
+    )
+
+
+# Writes every record of buf with its residues mapped through table, one line per sequence
+def write_converted_fasta(path, buf, table, block=1 << 20):
+    with open(path, "wb") as fasta:
+        for label, start, end in iter_record_spans(buf):
+            fasta.write(b">" + label.encode("utf-8") + b"\n")
+            cursor = RecordCursor(buf, start, end, table)
+            for data in iter(lambda: cursor.read(block), b""):
+                fasta.write(data)
+            fasta.write(b"\n")
+
+
+def convert_file_fused(f, nexus_path, table, insert_gap_at, interleave=None, conv_path=None):
+    """
+    Convert the characters of a FASTA file and write its NEXUS version
+    in one pass: the residues are mapped through ``table`` as they are
+    read, so no converted FASTA file has to be written and parsed again.
+    It is only written, to ``conv_path``, if that is given. Failures are
+    reported in the result like ``convert_file``.
+    """
+    f = Path(f)
+    try:
+        with tracing.span("fused conversion", file=str(f)):
+            with map_file(f) as buf:
+                if conv_path is not None:
+                    write_converted_fasta(conv_path, buf, table)
+                if interleave is not None:
+                    records = record_cursors(buf, table)
+                    genNexusInterleaved(nexus_path, records, insert_gap_at, interleave)
+                else:
+                    seqs = dict(iter_records(buf, table))
+                    genNexus(nexus_path, seqs, insert_gap_at)
+        return ConversionResult(path=str(f), nbytes=f.stat().st_size)
+    except Exception as e:
+        return ConversionResult(path=str(f), error=f"{type(e).__name__}: {e}")
+
+
+# Fused conversions of (input, nexus_path, conv_path or None) triples, in parallel like convert_files
+def convert_files_fused(conversions, table, insert_gap_at, jobs=1, interleave=None):
+    inputs, nexus_paths, conv_paths = zip(*conversions) if conversions else ((), (), ())
+    if jobs > 1 and len(conversions) > 1:
+        chunksize = max(1, len(conversions) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(
+                pool.map(
+                    convert_file_fused,
+                    inputs,
+                    nexus_paths,
+                    repeat(table),
+                    repeat(insert_gap_at),
+                    repeat(interleave),
+                    conv_paths,
+                    chunksize=chunksize,
+                )
+            )
+    return [
+        convert_file_fused(f, nexus_path, table, insert_gap_at, interleave, conv_path)
+        for f, nexus_path, conv_path in conversions
+    ]
+
+
+# Converts all files, fanning them out over a process pool if jobs > 1. Results keep the input order
+def convert_files(files, insert_gap_at, jobs=1, packed=False, interleave=None):
+    if jobs > 1 and len(files) > 1:
+        chunksize = max(1, len(files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(
+                pool.map(
+                    convert_file,
+                    files,
+                    repeat(insert_gap_at),
+                    repeat(packed),
+                    repeat(interleave),
+                    chunksize=chunksize,
+                )
+            )
+    return [convert_file(f, insert_gap_at, packed, interleave) for f in files]
+
+
 # Carries out the functions from above and names the output files
 def main(args):
     """Usage: Argument after --inFile should either be listed manually or expanded using $(find [directory] -name [filename])."""
-    for n, f in enumerate(args.inFile):
-        f = Path(f)
-        seqs = prepinfile(f)
-        output_path = f.with_suffix(".nexus")
-        genNexus(output_path, seqs, args.insert_gap_at)
-    print(f"{n+1} FASTA files converted successfully.")
-    return
+    start = time.perf_counter()
+    if args.char_map is not None:
+        table = char_table(dict(pair.split("=", 1) for pair in args.char_map))
+        results = convert_files_fused(
+            [(f, Path(f).with_suffix(".nexus"), None) for f in args.inFile],
+            table,
+            args.insert_gap_at,
+            args.jobs,
+            args.interleave,
+        )
+    else:
+        results = convert_files(
+            args.inFile, args.insert_gap_at, args.jobs, args.write_packed, args.interleave
+        )
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r.error is not None]
+    for r in failed:
+        print(f"Failed to convert {r.path}: {r.error}", file=sys.stderr)
+    converted = len(results) - len(failed)
+    nbytes = sum(r.nbytes for r in results)
+    rate = converted / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{converted} FASTA files converted successfully "
+        f"({nbytes} bytes read, {rate:.1f} files/sec)."
+    )
+    if failed:
+        print(f"{len(failed)} FASTA files could not be converted.")
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
     args = readArguments()
-    main(args)
+    sys.exit(main(args))
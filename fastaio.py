@@ -0,0 +1,244 @@
+#! /usr/bin/env python3
+
+import argparse
+from contextlib import contextmanager
+import mmap
+import os
+from pathlib import Path
+import shutil
+from typing import List
+
+import attr
+
+INDEX_SUFFIX = ".fxi"
+INDEX_MAGIC = "#fxi"
+WHITESPACE = b" \t\r\n"
+
+
+# Command line arguments
+def readArguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--inFile",
+        type=str,
+        nargs="+",
+        required=True,
+        help="FASTA file(s) to index. The index is written next to each file as <file>.fxi and is rebuilt whenever the file's size or modification time changes.",
+    )
+    args = parser.parse_args()
+    return args
+
+
+@attr.s(frozen=True, slots=True)
+class FastaIndexEntry:
+    # Full header line without the leading '>'
+    header: str = attr.ib()
+    # Number of residues in the record
+    length: int = attr.ib()
+    # Byte offset of the first sequence byte
+    offset: int = attr.ib()
+    # Number of raw bytes (line breaks included) spanned by the sequence
+    nbytes: int = attr.ib()
+
+    @property
+    def name(self):
+        return record_name(self.header)
+
+
+# Same as Bio.SeqIO: the name of a record is the first word of its header
+def record_name(header):
+    words = header.split(None, 1)
+    return words[0] if words else ""
+
+
+# Memory-maps a file read-only. Empty files cannot be mapped, so they yield an empty bytes object
+@contextmanager
+def map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+
+def iter_record_spans(buf):
+    """
+    Scan a FASTA buffer with ``find`` and yield ``(header, start, end)``
+    for each record, where ``buf[start:end]`` is the raw sequence data
+    including line breaks. No per-line or per-character objects are
+    created.
+    """
+    size = len(buf)
+    pos = buf.find(b">")
+    if pos < 0:
+        pos = size
+    if buf[:pos].strip():
+        raise Exception("Sequence data found before label")
+    while pos < size:
+        eol = buf.find(b"\n", pos)
+        if eol < 0:
+            eol = size
+        header = buf[pos + 1 : eol].rstrip(b"\r").decode("utf-8")
+        start = min(eol + 1, size)
+        end = buf.find(b"\n>", eol)
+        end = size if end < 0 else end + 1
+        yield header, start, end
+        pos = end
+
+
+# Yields (header, sequence) pairs with the sequence as bytes stripped of line breaks and mapped through table
+def iter_records(buf, table=None):
+    for header, start, end in iter_record_spans(buf):
+        yield header, buf[start:end].translate(table, WHITESPACE)
+
+
+# Number of residues in buf[start:end], counted a block at a time so the record is never copied whole
+def residue_count(buf, start, end, block=1 << 20):
+    return sum(
+        len(buf[pos : min(pos + block, end)].translate(None, WHITESPACE))
+        for pos in range(start, end, block)
+    )
+
+
+class RecordCursor:
+    """
+    Reads the residues of one record of a FASTA buffer front to back,
+    ``n`` at a time, skipping line breaks and mapping the residues
+    through the ``bytes.translate`` table ``table`` if one is given. At
+    most about ``n`` residues are held at once.
+    """
+
+    def __init__(self, buf, start, end, table=None):
+        self.buf = buf
+        self.pos = start
+        self.end = end
+        self.table = table
+        self.pending = b""
+
+    def read(self, n) -> bytes:
+        while len(self.pending) < n and self.pos < self.end:
+            stop = min(self.pos + n, self.end)
+            self.pending += self.buf[self.pos : stop].translate(self.table, WHITESPACE)
+            self.pos = stop
+        data, self.pending = self.pending[:n], self.pending[n:]
+        return data
+
+
+# Appends src to the open file dst, in the kernel where possible
+def append_file(src, dst):
+    dst.flush()
+    offset = dst.tell()
+    with open(src, "rb") as part:
+        remaining = os.fstat(part.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(part.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    raise OSError("copy_file_range stopped before the end of the file")
+                remaining -= copied
+            return
+        except (AttributeError, OSError):
+            # No copy_file_range on this platform or file system. Whatever it
+            # copied before failing is cut off again, so nothing is written twice
+            pass
+        part.seek(0)
+        dst.seek(offset)
+        dst.truncate()
+        shutil.copyfileobj(part, dst)
+        dst.flush()
+
+
+# Reads a whole FASTA file into a list of (name, sequence) string pairs
+def read_records(fasta_path):
+    with map_file(fasta_path) as buf:
+        return [
+            (record_name(header), seq.decode("ascii"))
+            for header, seq in iter_records(buf)
+        ]
+
+
+def index_path(fasta_path):
+    return Path(str(fasta_path) + INDEX_SUFFIX)
+
+
+# Scans the FASTA file once and records where each sequence starts and how long it is
+def build_index(fasta_path) -> List[FastaIndexEntry]:
+    with map_file(fasta_path) as buf:
+        return [
+            FastaIndexEntry(
+                header,
+                len(buf[start:end].translate(None, WHITESPACE)),
+                start,
+                end - start,
+            )
+            for header, start, end in iter_record_spans(buf)
+        ]
+
+
+def write_index(fasta_path, entries):
+    stat = os.stat(fasta_path)
+    path = index_path(fasta_path)
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        out.write(f"{INDEX_MAGIC}\t{stat.st_size}\t{stat.st_mtime_ns}\n")
+        for e in entries:
+            out.write(f"{e.length}\t{e.offset}\t{e.nbytes}\t{e.header}\n")
+    os.replace(tmp_path, path)
+
+
+# Returns the stored index, or None if it is missing or was built for a different version of the file
+def read_index(fasta_path):
+    stat = os.stat(fasta_path)
+    try:
+        with open(index_path(fasta_path), "r", encoding="utf-8") as idx:
+            magic, size, mtime_ns = idx.readline().rstrip("\n").split("\t")
+            if (
+                magic != INDEX_MAGIC
+                or int(size) != stat.st_size
+                or int(mtime_ns) != stat.st_mtime_ns
+            ):
+                return None
+            entries = []
+            for line in idx:
+                length, offset, nbytes, header = line.rstrip("\n").split("\t", 3)
+                entries.append(
+                    FastaIndexEntry(header, int(length), int(offset), int(nbytes))
+                )
+            return entries
+    except (OSError, ValueError):
+        return None
+
+
+def load_index(fasta_path) -> List[FastaIndexEntry]:
+    """
+    Return the index of ``fasta_path``, rebuilding and storing it next to
+    the file if it is missing or stale. If the directory is not writable,
+    the freshly built index is returned without being stored.
+    """
+    entries = read_index(fasta_path)
+    if entries is None:
+        entries = build_index(fasta_path)
+        try:
+            write_index(fasta_path, entries)
+        except OSError:
+            pass
+    return entries
+
+
+# Seeks to a single record and returns its sequence without line breaks
+def read_sequence(fasta, entry):
+    fasta.seek(entry.offset)
+    return fasta.read(entry.nbytes).translate(None, WHITESPACE).decode("ascii")
+
+
+def main(args):
+    for f in args.inFile:
+        entries = load_index(f)
+        print(f"{f}: {len(entries)} records indexed.")
+    return
+
+
+if __name__ == "__main__":
+    args = readArguments()
+    main(args)
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
+import os
 from pathlib import Path
-from subprocess import check_call
+from random import SystemRandom
 import re
 import shutil
 from typing import Dict
 
 import attr
 
+from catalog import CATALOG_NAME, Catalog, run_record
+from fastaio import append_file
+from subsamplefasta import draw_seeded_samples, load_records, write_samples
+import tracing
+
 
 @attr.s
 class FreqFileResult:
@@ -17,6 +25,164 @@ class FreqFileResult:
     freq: str = attr.ib()
 
 
+@attr.s
+class GenerateOptions:
+    output_base_path: Path = attr.ib()
+    sample_count: int = attr.ib()
+    seed: int = attr.ib()
+    insertgaps: int = attr.ib()
+    # Base of the per-(freq, case, iteration) seeds the samples are drawn with
+    sample_seed: int = attr.ib()
+    # Compose sample files with hardlinks and in-kernel copies instead of copying through Python
+    link_samples: bool = attr.ib(default=False)
+
+
+# Seed of one sample, so that it does not depend on which worker draws it or when
+def sample_seed(base_seed, freq, case, kind, iteration) -> int:
+    key = f"{base_seed}\0{freq}\0{case}\0{kind}\0{iteration}".encode("utf-8")
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "little")
+
+
+# Draws <number>-sequence samples of records for every iteration and writes them to out/<outFile>_<i>.fasta
+def subsample(options, records, out: Path, outFile, number, freq, case, kind):
+    if len(records) == 0:
+        raise ValueError(f"No sequences to sample for freq{freq}/{case}.")
+    seeds = [
+        sample_seed(options.sample_seed, freq, case, kind, i)
+        for i in range(1, options.sample_count + 1)
+    ]
+    samples = draw_seeded_samples(len(records), number, seeds)
+    with tracing.span("write samples", freq=freq, case=case, kind=kind):
+        write_samples(records, samples, str(out / outFile))
+
+
+# Writes the concatenation of sources to path. With link, a single source is hardlinked and several are joined with copy_file_range, which file systems with reflinks can share extents for.
+def compose_file(path: Path, sources, link=False):
+    if link and len(sources) == 1:
+        try:
+            os.link(sources[0], path)
+            return
+        except OSError:
+            # e.g. a file system without hardlinks
+            pass
+    with open(path, "wb") as wfile:
+        for source in sources:
+            if link:
+                append_file(source, wfile)
+            else:
+                with open(source, "rb") as rfile:
+                    shutil.copyfileobj(rfile, wfile)
+
+
+# This function checks if the output folder exists and if not, creates it. Then, it samples 1 sequence from either the same or different clone to combine with the original 6 sequence samples that were pre-created.
+def create_output_directory(
+    options: GenerateOptions,
+    freq: str,
+    case: str,
+    combined_from_path: Path = None,
+    is_same_clone=False,
+):
+    is_combined = combined_from_path is not None
+
+    out = options.output_base_path / f"freq{freq}" / case
+    sameclone_path = options.output_base_path / f"freq{freq}" / "sameclone"
+
+    try:
+        out.mkdir(parents=True)
+    except FileExistsError:
+        print(f"Skipping existing MCMC run folder {out!s}.")
+        return out / "parameters.json"
+
+    print(f"Created MCMC run folder {out!s}.")
+
+    # The clone file is read once for all the samples drawn from it
+    if is_combined:
+        with tracing.span("load records", file=str(combined_from_path)):
+            records = load_records(str(combined_from_path))
+
+    # Want to generate the 6 sequence samples only once
+    if is_same_clone:
+        subsample(options, records, out, "6seq_samp", 6, freq, case, "6seq")
+
+    if is_combined:
+        subsample(options, records, out, "1seq_samp", 1, freq, case, "1seq")
+
+    # Name input files
+    inputs = []
+    for i in range(1, options.sample_count + 1):
+        input_name = f"{case}_samp_{i}.fasta"
+
+        sources = [sameclone_path / f"6seq_samp_{i}.fasta"]
+        # Append the file to be combined
+        if is_combined:
+            sources.append(out / f"1seq_samp_{i}.fasta")
+        with tracing.span("compose", freq=freq, case=case, sample=i):
+            compose_file(out / input_name, sources, options.link_samples)
+
+        inputs.append(input_name)
+
+    # Write metadata for this MCMC run
+    meta = {
+        "origin.is_combined": is_combined,
+        "origin.freq": freq,
+        "origin.prefix": case,
+        "origin.sample_seed": options.sample_seed,
+        "inputs": inputs,
+        "mcmc.nst": 6,
+        "mcmc.rates": "invgamma",
+        "mcmc.ngammacat": 4,
+        "mcmc.brlenspr": "unconstrained:GammaDir(1.0,0.100,1.0,1.0)",
+        "mcmc.shapepr": "exp(1.0)",
+        "mcmc.statefreqpr": "dirichlet(1.0,1.0,1.0,1.0)",
+        "mcmc.revmatpr": "Dirichlet(1.0,1.0,1.0,1.0,1.0,1.0)",
+        "mcmc.seed": options.seed,
+        "mcmc.ngen": 10_000_000,
+        "mcmc.samplefreq": 1000,
+        "mcmc.printfreq": 1000,
+        "mcmc.burninfrac": 0.1,
+        "mcmc.nchains": 4,
+        "mcmc.nruns": 2,
+        "mcmc.autoclose": True,
+        "mcmc.nowarnings": True,
+        "fasta_to_nexus.insert_gap_at": options.insertgaps,
+    }
+    if is_combined:
+        meta["origin.combine_path"] = str(combined_from_path)
+
+    (out / "parameters.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return out / "parameters.json"
+
+
+# Creates the three case folders of one frequency and returns their catalog records
+def generate_frequency(options: GenerateOptions, freq: str, sameclone_path, diffclone_path):
+    with tracing.span("frequency", freq=freq):
+        # Blocks below determine the clone categories (the original 6 sequences or combined with a sequence from the same or different clone) and also define important variables
+        with tracing.span("case", freq=freq, case="sameclone"):
+            sameclone = create_output_directory(
+                options,
+                freq=freq,
+                is_same_clone=True,
+                combined_from_path=sameclone_path,
+                case="sameclone",
+            )
+
+        with tracing.span("case", freq=freq, case="baseline"):
+            baseline = create_output_directory(
+                options, freq=freq, combined_from_path=None, case="baseline"
+            )
+
+        with tracing.span("case", freq=freq, case="diffclone"):
+            diffclone = create_output_directory(
+                options,
+                freq=freq,
+                combined_from_path=diffclone_path,
+                case="diffclone",
+            )
+        # A skipped folder may have been left without parameters.json by an interrupted run
+        with tracing.span("catalog records", freq=freq):
+            return [run_record(p) for p in (sameclone, baseline, diffclone) if p.exists()]
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--output", "-o", help="Name of output directory.", required=True)
@@ -34,6 +200,33 @@ def main():
         type=int,
         help="The seed(s) you want to set for the MCMC random generator.",
     )
+    ap.add_argument(
+        "--sample-seed",
+        type=int,
+        help="Seed the sequence samples are drawn from. Each (freq, case, iteration) gets its own seed derived from it, so the samples do not depend on --jobs. Defaults to a random seed, which is recorded in every parameters.json as origin.sample_seed.",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes generating frequency folders in parallel.",
+    )
+    ap.add_argument(
+        "--link-samples",
+        action="store_true",
+        help="Hardlink the baseline sample files to sameclone's 6 sequence samples and build the combined ones with copy_file_range (reflinks where the file system supports them). The baseline files then share their inode with sameclone/6seq_samp_<i>.fasta, so don't edit them in place.",
+    )
+    ap.add_argument(
+        "--catalog",
+        type=Path,
+        help=f"Experiment catalog every run folder is registered in. Defaults to OUTPUT/{CATALOG_NAME}.",
+    )
+    ap.add_argument(
+        "--trace",
+        type=Path,
+        help="Write a Chrome trace of every frequency, case and sample to this JSON file and print a summary.",
+    )
     ap.add_argument(
         "--sameclonedata",
         "-scd",
@@ -51,153 +244,74 @@ def main():
         help="The location of the file(s) from which you sample the additional sequences from a different clone. Must not be the same file(s) as those specified by --sameclonedata.",
     )
     A = ap.parse_args()
-
-    output_base_path = Path(A.output).resolve()
-
-    SAMPLE_COUNT = int(A.number)
-
-    # This function checks if the output folder exists and if not, creates it. Then, it runs the subsampler to randomly sample 1 sequence from either the same or different clone to combine with the original 6 sequence samples that were pre-created.
-    def create_output_directory(
-        freq: str, case: str, combined_from_path: Path = None, is_same_clone=False
-    ):
-        is_combined = combined_from_path is not None
-
-        out = output_base_path / f"freq{freq}" / case
-        sameclone_path = output_base_path / f"freq{freq}" / "sameclone"
-
-        try:
-            out.mkdir(parents=True)
-        except FileExistsError:
-            print(f"Skipping existing MCMC run folder {out!s}.")
-            return
-
-        print(f"Created MCMC run folder {out!s}.")
-
-        # Want to generate the 6 sequence samples only once
-        if is_same_clone:
-            check_call(
-                [
-                    "subsamplefasta.py",
-                    "--inFile",
-                    str(combined_from_path),
-                    "--outFile",
-                    "6seq_samp",
-                    "--number",
-                    "6",
-                    "--iterations",
-                    str(SAMPLE_COUNT),
-                ],
-                cwd=str(out),
-            )
-
-        if is_combined:
-            check_call(
-                [
-                    "subsamplefasta.py",
-                    "--inFile",
-                    str(combined_from_path),
-                    "--outFile",
-                    "1seq_samp",
-                    "--number",
-                    "1",
-                    "--iterations",
-                    str(SAMPLE_COUNT),
-                ],
-                cwd=str(out),
-            )
-
-        # Name input files
-        inputs = []
-        for i in range(1, SAMPLE_COUNT + 1):
-            input_name = f"{case}_samp_{i}.fasta"
-
-            with open(out / input_name, "wb") as wfile:
-                with open(sameclone_path / f"6seq_samp_{i}.fasta", "rb") as rfile:
-                    shutil.copyfileobj(rfile, wfile)
-
-                # Append the file to be combined
-                if is_combined:
-                    with open(out / f"1seq_samp_{i}.fasta", "rb") as rfile:
-                        shutil.copyfileobj(rfile, wfile)
-
-            inputs.append(input_name)
-
-        # Write metadata for this MCMC run
-        meta = {
-            "origin.is_combined": is_combined,
-            "origin.freq": freq,
-            "origin.prefix": case,
-            "inputs": inputs,
-            "mcmc.nst": 6,
-            "mcmc.rates": "invgamma",
-            "mcmc.ngammacat": 4,
-            "mcmc.brlenspr": "unconstrained:GammaDir(1.0,0.100,1.0,1.0)",
-            "mcmc.shapepr": "exp(1.0)",
-            "mcmc.statefreqpr": "dirichlet(1.0,1.0,1.0,1.0)",
-            "mcmc.revmatpr": "Dirichlet(1.0,1.0,1.0,1.0,1.0,1.0)",
-            "mcmc.seed": None if A.seed is None else int(A.seed),
-            "mcmc.ngen": 10_000_000,
-            "mcmc.samplefreq": 1000,
-            "mcmc.printfreq": 1000,
-            "mcmc.burninfrac": 0.1,
-            "mcmc.nchains": 4,
-            "mcmc.nruns": 2,
-            "mcmc.autoclose": True,
-            "mcmc.nowarnings": True,
-            "fasta_to_nexus.insert_gap_at": None
-            if A.insertgaps is None
-            else int(A.insertgaps),
-        }
-        if is_combined:
-            meta["origin.combine_path"] = str(combined_from_path)
-
-        (out / "parameters.json").write_text(
-            json.dumps(meta, indent=2), encoding="utf-8"
-        )
+    if A.trace is not None:
+        tracing.enable(A.trace.resolve())
+    try:
+        generate(A)
+    finally:
+        tracing.finish()
+
+
+def generate(A):
+    options = GenerateOptions(
+        output_base_path=Path(A.output).resolve(),
+        sample_count=int(A.number),
+        seed=None if A.seed is None else int(A.seed),
+        insertgaps=None if A.insertgaps is None else int(A.insertgaps),
+        sample_seed=SystemRandom().getrandbits(63)
+        if A.sample_seed is None
+        else A.sample_seed,
+        link_samples=A.link_samples,
+    )
 
     def find_files_by_pattern(dirname_and_pattern) -> Dict[float, FreqFileResult]:
         dirname, pattern = dirname_and_pattern
 
         if pattern == "":
-            pattern = "freq([.0-9]+)"
+            # A number like 0.25, not the "." before the file suffix
+            pattern = r"freq([0-9]+(?:\.[0-9]+)?)"
+        regex = re.compile(pattern)
 
         files = {}
-        for path in Path(dirname).iterdir():
-            m = re.search(pattern, path.name)
-            print(path.name)
-            print(m)
-            if not m:
-                continue
+        with os.scandir(dirname) as entries:
+            for entry in entries:
+                m = regex.search(entry.name)
+                if not m:
+                    continue
 
-            freq = m.group(1)
+                freq = m.group(1)
 
-            files[float(freq)] = FreqFileResult(path=path, freq=freq)
+                files[float(freq)] = FreqFileResult(path=Path(entry.path), freq=freq)
 
+        print(f"Found {len(files)} frequency files in {dirname}.")
         return files
 
     sameclone_files = find_files_by_pattern(A.sameclonedata)
     diffclone_files = find_files_by_pattern(A.diffclonedata)
 
-    for freq, sameclone_file in sameclone_files.items():
-        freq_str = sameclone_file.freq
-
-        diffclone_file = diffclone_files[freq]
-
-        # Blocks below determine the clone categories (the original 6 sequences or combined with a sequence from the same or different clone) and also define important variables
-        create_output_directory(
-            freq=freq_str,
-            is_same_clone=True,
-            combined_from_path=sameclone_file.path.resolve(),
-            case="sameclone",
-        )
-
-        create_output_directory(freq=freq_str, combined_from_path=None, case="baseline")
-
-        create_output_directory(
-            freq=freq_str,
-            combined_from_path=diffclone_file.path.resolve(),
-            case="diffclone",
+    tasks = [
+        (
+            sameclone_file.freq,
+            sameclone_file.path.resolve(),
+            diffclone_files[freq].path.resolve(),
         )
+        for freq, sameclone_file in sameclone_files.items()
+    ]
+    catalog_path = A.catalog or options.output_base_path / CATALOG_NAME
+    options.output_base_path.mkdir(parents=True, exist_ok=True)
+    with Catalog(catalog_path) as catalog:
+        if A.jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=A.jobs) as pool:
+                futures = [
+                    pool.submit(generate_frequency, options, *task) for task in tasks
+                ]
+                for (freq, _, _), future in zip(tasks, futures):
+                    catalog.add(future.result())
+                    print(f"Generated freq{freq}.")
+        else:
+            for task in tasks:
+                catalog.add(generate_frequency(options, *task))
+    print(f"Registered the run folders in {catalog_path}.")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 #! /usr/bin/env python3
 
 import argparse
-from numpy import array
-from numpy import transpose
+import heapq
+from itertools import repeat
+import re
 
 
 def readArguments():
@@ -135,154 +136,235 @@ def readArguments():
         required=False,
         help="Sets seed(s) for the random number generator. For fully reproducible results, use this option.",
     )
+    parser.add_argument(
+        "--checkpoint",
+        nargs="+",
+        type=str,
+        required=False,
+        help="Available arguments: yes, no. Whether MrBayes writes checkpoints (<file>.ckp) during the run. Left to MrBayes' default (yes) if absent.",
+    )
+    parser.add_argument(
+        "--checkfreq",
+        nargs="+",
+        type=str,
+        required=False,
+        help="Number of generations between checkpoints. Positive integers only. Left to MrBayes' default if absent.",
+    )
+    parser.add_argument(
+        "--append",
+        nargs="+",
+        type=str,
+        required=False,
+        help="Available arguments: yes, no. Setting this to yes continues an interrupted run from its checkpoint and appends to its output files.",
+    )
+    parser.add_argument(
+        "--shards",
+        type=parse_shards,
+        required=False,
+        help="Instead of <outfile>.nexus, write the blocks to N files <outfile>.shard<k>.nexus (or one per input file with 'sample'), balanced by the estimated cost ntax * nchar * ngen * nchains of each file, so that one mb process can run each of them at the same time.",
+    )
     args = parser.parse_args()
     return args
 
 
-# Takes in command line arguments and formats them into a MrBayes block
-def paraminputs(outfile, args):
-    outfile.write(
-        "\tlset nst="
-        + str(args.nst)
-        + " rates="
-        + str(args.rates)
-        + " ngammacat="
-        + str(args.ngammacat)
-        + ";\n"
-    )
-    outfile.write(
-        "\tprset brlenspr="
-        + str(args.brlenspr)
-        + " shapepr="
-        + str(args.shapepr)
-        + " statefreqpr="
-        + str(args.statefreqpr)
-        + " revmatpr="
-        + str(args.revmatpr)
-        + ";\n"
-    )
-    outfile.write(
-        "\tmcmc ngen="
-        + str(args.ngen)
-        + " samplefreq="
-        + str(args.samplefreq)
-        + " printfreq="
-        + str(args.printfreq)
-        + " burninfrac="
-        + str(args.burninfrac)
-        + " nchains="
-        + str(args.nchains)
-        + " nruns="
-        + str(args.nruns)
-        + ";\n"
-    )
-    outfile.write("\tsumt;\n")
-    outfile.write("end;\n\n")
-    return
-
-
-# Generates the block if all mcmc runs have the same parameters (only one argument specified)
-def genblock(outfile, args):
-    filenames = args.inpath
-    for f in filenames:
-        outfile.write("begin mrbayes;\n")
-        outfile.write(
-            "\tset autoclose="
-            + str(args.autoclose)
-            + " nowarnings="
-            + str(args.nowarnings)
-            + " seed="
-            + str(args.seed)
-            + ";\n"
-        )
-        outfile.write("\texecute " + str(f) + ";\n")
-        paraminputs(outfile, args)
-    return
-
-
-# Generates the block if user wants to have different parameters for each mcmc run (multiple arguments specified)
-def genblock2(outfile, params, args):
-    filenames = args.inpath
-    arg_array = array(params)
-    t_array = transpose(arg_array)
-    for row, f in zip(t_array, filenames):
-        outfile.write("begin mrbayes;\n")
-        outfile.write(
-            "\tset autoclose=" + str(row[13]) + " seed=" + str(row[15]) + " nowarnings=" + str(row[14]) + ";\n"
-        )
-        outfile.write("\texecute " + str(f) + ";\n")
-        outfile.write(
-            "\tlset nst="
-            + str(row[0])
-            + " rates="
-            + str(row[1])
-            + " ngammacat="
-            + str(row[2])
-            + ";\n"
-        )
-        outfile.write(
-            "\tprset brlenspr="
-            + str(row[3])
-            + " shapepr="
-            + str(row[4])
-            + " statefreqpr="
-            + str(row[5])
-            + " revmatpr="
-            + str(row[6])
-            + ";\n"
-        )
-        outfile.write(
-            "\tmcmc ngen="
-            + str(row[7])
-            + " samplefreq="
-            + str(row[8])
-            + " printfreq="
-            + str(row[9])
-            + " burninfrac="
-            + str(row[10])
-            + " nchains="
-            + str(row[11])
-            + " nruns="
-            + str(row[12])
-            + ";\n"
+# Number of shards, or "sample" for one per input file
+def parse_shards(value):
+    if value == "sample":
+        return value
+    nshards = int(value)
+    if nshards < 1:
+        raise argparse.ArgumentTypeError("the number of shards must be positive")
+    return nshards
+
+
+# Parameters of a MrBayes block, in command line order
+PARAM_NAMES = (
+    "nst",
+    "rates",
+    "ngammacat",
+    "brlenspr",
+    "shapepr",
+    "statefreqpr",
+    "revmatpr",
+    "ngen",
+    "samplefreq",
+    "printfreq",
+    "burninfrac",
+    "nchains",
+    "nruns",
+    "autoclose",
+    "nowarnings",
+    "seed",
+    "checkpoint",
+    "checkfreq",
+    "append",
+)
+
+# Parameters that may be left out, with the values used then
+OPTIONAL_PARAMS = {
+    "autoclose": "no",
+    "nowarnings": "no",
+    "seed": None,
+    "checkpoint": None,
+    "checkfreq": None,
+    "append": None,
+}
+
+# Parameters written as " name=value" only when they have a value
+CLAUSE_PARAMS = ("seed", "checkpoint", "checkfreq", "append")
+
+# One MrBayes block, rendered once per input file
+BLOCK_TEMPLATE = (
+    "begin mrbayes;\n"
+    "\tset autoclose={autoclose} nowarnings={nowarnings}{seed};\n"
+    "\texecute {path};\n"
+    "\tlset nst={nst} rates={rates} ngammacat={ngammacat};\n"
+    "\tprset brlenspr={brlenspr} shapepr={shapepr} statefreqpr={statefreqpr} revmatpr={revmatpr};\n"
+    "\tmcmc ngen={ngen} samplefreq={samplefreq} printfreq={printfreq} burninfrac={burninfrac} nchains={nchains} nruns={nruns}{checkpoint}{checkfreq}{append};\n"
+    "\tsumt;\n"
+    "end;\n\n"
+).format
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    return str(value)
+
+
+# Turns a parameter into an iterator over one value per file
+def _per_file(name, value, nfiles):
+    if isinstance(value, (list, tuple)):
+        if len(value) == 1:
+            return repeat(value[0])
+        if len(value) != nfiles:
+            raise ValueError(
+                f"--{name} has {len(value)} values, expected 1 or one per input file ({nfiles})."
+            )
+        return iter(value)
+    return repeat(value)
+
+
+def write_blocks(paths, params, stream):
+    """
+    Write one MrBayes block per NEXUS file in ``paths`` to ``stream``.
+
+    ``params`` maps each name in ``PARAM_NAMES`` to either a single value
+    used for every file or a list with one value per file. Only the names
+    in ``OPTIONAL_PARAMS`` may be missing. Booleans are written as yes/no,
+    and ``CLAUSE_PARAMS`` without a value are left out so that MrBayes
+    uses its own defaults. Blocks are rendered and written one at a time.
+    """
+    paths = list(paths)
+    missing = [
+        name
+        for name in PARAM_NAMES
+        if params.get(name) is None and name not in OPTIONAL_PARAMS
+    ]
+    if missing:
+        raise ValueError(f"Missing MrBayes parameters: {', '.join(missing)}")
+    columns = [
+        _per_file(
+            name,
+            OPTIONAL_PARAMS.get(name) if params.get(name) is None else params[name],
+            len(paths),
         )
-        outfile.write("\tsumt;\n")
-        outfile.write("end;\n\n")
+        for name in PARAM_NAMES
+    ]
+    for path, row in zip(paths, zip(*columns)):
+        values = {name: _format_value(v) for name, v in zip(PARAM_NAMES, row)}
+        for name in CLAUSE_PARAMS:
+            value = row[PARAM_NAMES.index(name)]
+            values[name] = "" if value is None else f" {name}={_format_value(value)}"
+        stream.write(BLOCK_TEMPLATE(path=path, **values))
+    return len(paths)
+
+
+DIMENSIONS = re.compile(rb"dimensions\s+ntax\s*=\s*(\d+)\s+nchar\s*=\s*(\d+)", re.IGNORECASE)
+
+
+# (ntax, nchar) from the dimensions command near the top of a NEXUS file
+def nexus_dimensions(path):
+    with open(path, "rb") as nexus:
+        head = nexus.read(4096)
+    m = DIMENSIONS.search(head)
+    if m is None:
+        raise ValueError(f"No dimensions command found in {path}")
+    return int(m.group(1)), int(m.group(2))
+
+
+# Estimated cost of the block of every NEXUS file in paths: ntax * nchar * ngen * nchains
+def block_costs(paths, params):
+    paths = list(paths)
+    ngens = _per_file("ngen", params["ngen"], len(paths))
+    nchains = _per_file("nchains", params["nchains"], len(paths))
+    costs = []
+    for path, ngen, chains in zip(paths, ngens, nchains):
+        ntax, nchar = nexus_dimensions(path)
+        costs.append(ntax * max(nchar, 1) * int(ngen) * int(chains))
+    return costs
+
+
+def balance_shards(costs, nshards):
+    """
+    Split the files with the given costs into at most ``nshards`` shards
+    of similar total cost by assigning the most expensive file left to
+    the cheapest shard so far (longest processing time first). Returns
+    the file indices of every non-empty shard, in input order.
+    """
+    heap = [(0, k) for k in range(min(nshards, len(costs)))]
+    shards = [[] for _ in heap]
+    for index in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        total, k = heapq.heappop(heap)
+        shards[k].append(index)
+        heapq.heappush(heap, (total + costs[index], k))
+    return [sorted(shard) for shard in shards if shard]
+
+
+# The parameters of the files at indices, with per-file value lists cut down to them
+def select_params(params, indices, nfiles):
+    selected = {}
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)) and len(value) > 1:
+            if len(value) != nfiles:
+                raise ValueError(
+                    f"--{name} has {len(value)} values, expected 1 or one per input file ({nfiles})."
+                )
+            value = [value[i] for i in indices]
+        selected[name] = value
+    return selected
+
+
+def write_shards(paths, params, shards, shard_path):
+    """
+    Write the blocks of each shard of ``paths`` (lists of indices, as
+    returned by ``balance_shards``) to ``shard_path(k)`` for k = 1, 2, ...
+    MrBayes names the outputs of a block after the file it executes, so
+    shards never write to the same .t/.p files.
+    """
+    paths = list(paths)
+    for k, indices in enumerate(shards, 1):
+        with open(shard_path(k), "w") as stream:
+            write_blocks(
+                [paths[i] for i in indices],
+                select_params(params, indices, len(paths)),
+                stream,
+            )
+    return len(shards)
 
 
 # Executes above functions and writes the output file
 def main(args):
-    params_list = [
-        args.nst,
-        args.rates,
-        args.ngammacat,
-        args.brlenspr,
-        args.shapepr,
-        args.statefreqpr,
-        args.revmatpr,
-        args.ngen,
-        args.samplefreq,
-        args.printfreq,
-        args.burninfrac,
-        args.nchains,
-        args.nruns,
-        args.autoclose,
-        args.nowarnings,
-        args.seed,
-    ]
-    arg_lengths = sum(len(a) for a in params_list)
+    params = {name: getattr(args, name) for name in PARAM_NAMES}
     print("Creating MrBayes blocks...")
-    if arg_lengths == 16:
+    if args.shards is None:
         with open(args.outfile + ".nexus", "a+") as mbblocks:
-            genblock(mbblocks, args)
-        with open(args.outfile + ".nexus", "r+") as convert:
-            lines = convert.read()
-            converted = lines.replace("[", "").replace("'", "").replace("]", "")
-        with open(args.outfile + ".nexus", "w+") as mbblocks:
-            mbblocks.write(converted)
+            write_blocks(args.inpath, params, mbblocks)
     else:
-        with open(args.outfile + ".nexus", "a+") as mbblocks:
-            genblock2(mbblocks, params_list, args)
+        nshards = len(args.inpath) if args.shards == "sample" else args.shards
+        shards = balance_shards(block_costs(args.inpath, params), nshards)
+        write_shards(args.inpath, params, shards, lambda k: f"{args.outfile}.shard{k}.nexus")
+        print(f"Wrote {len(shards)} shards.")
     print("Done.")
 
 
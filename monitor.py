@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import Counter
+from math import sqrt
+import os
+from pathlib import Path
+import re
+from typing import List, Optional
+
+import attr
+import numpy as np
+
+from bipartitions import add_translate_entries, tree_splits
+
+TREE_GENERATION = re.compile(r"tree\s+gen\.(\d+)")
+
+
+@attr.s
+class Thresholds:
+    # Largest average standard deviation of split frequencies that counts as converged
+    max_asdsf: float = attr.ib(default=0.01)
+    # Smallest ESS of every .p column in every run
+    min_ess: float = attr.ib(default=200.0)
+    # Number of consecutive samples both criteria have to hold for
+    consecutive: int = attr.ib(default=10)
+    # Splits rarer than this in all runs are left out of the ASDSF, as in MrBayes
+    min_partfreq: float = attr.ib(default=0.1)
+    # Samples between ESS computations, each of which is a full FFT over the kept samples
+    ess_interval: int = attr.ib(default=10)
+
+    @classmethod
+    def from_meta(cls, meta):
+        defaults = cls()
+        return cls(
+            max_asdsf=float(meta.get("monitor.max_asdsf", defaults.max_asdsf)),
+            min_ess=float(meta.get("monitor.min_ess", defaults.min_ess)),
+            consecutive=int(meta.get("monitor.consecutive", defaults.consecutive)),
+            min_partfreq=float(meta.get("monitor.min_partfreq", defaults.min_partfreq)),
+            ess_interval=int(meta.get("monitor.ess_interval", defaults.ess_interval)),
+        )
+
+
+class LineTail:
+    """
+    Reads the complete lines appended to a file since the last call. A
+    line still being written is kept back until its newline arrives.
+    Files last modified before ``since`` (in ns) are treated as not yet
+    written, so outputs left over from an earlier run are ignored.
+    """
+
+    def __init__(self, path: Path, since=None):
+        self.path = path
+        self.since = since
+        self.offset = 0
+        self.partial = b""
+
+    def read_lines(self) -> List[str]:
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if self.since is not None and stat.st_mtime_ns < self.since:
+                    return []
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        self.offset += len(data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        return [line.decode("utf-8") for line in lines]
+
+
+class RunTrace:
+    """The samples of one MrBayes run read so far from its .t and .p files."""
+
+    def __init__(self, prefix, since=None):
+        self.trees = LineTail(Path(f"{prefix}.t"), since)
+        self.params = LineTail(Path(f"{prefix}.p"), since)
+        self.taxon_bits = {}
+        self.in_translate = False
+        # Generation and nontrivial splits of every tree
+        self.generations = []
+        self.splits = []
+        self.columns = None
+        self.values = []
+
+    def poll(self):
+        for line in self.trees.read_lines():
+            stripped = line.strip()
+            if self.in_translate:
+                self.in_translate = add_translate_entries(stripped, self.taxon_bits)
+            elif stripped.lower() == "translate":
+                self.in_translate = True
+            elif stripped.startswith("tree "):
+                self.generations.append(int(TREE_GENERATION.match(stripped).group(1)))
+                clades = tree_splits(stripped.split("=", 1)[1], self.taxon_bits)
+                ntax = len(self.taxon_bits)
+                self.splits.append(
+                    frozenset(
+                        clade for clade, _ in clades if bin(clade).count("1") < ntax - 1
+                    )
+                )
+        for line in self.params.read_lines():
+            fields = line.split()
+            if not fields or fields[0].startswith("["):
+                continue
+            if self.columns is None:
+                self.columns = fields
+            else:
+                self.values.append([float(v) for v in fields[1:]])
+
+    # Number of samples present in both files
+    def __len__(self):
+        return min(len(self.splits), len(self.values))
+
+
+def effective_sample_size(x) -> float:
+    """
+    ESS of one parameter trace, with the autocorrelation time estimated
+    by Geyer's initial positive sequence. Constant traces have an
+    infinite ESS.
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    if n < 4:
+        return 0.0
+    x = x - x.mean()
+    variance = x.dot(x) / n
+    if variance == 0:
+        return float("inf")
+    spectrum = np.fft.rfft(x, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n] / (n * variance)
+    pairs = acf[: n - n % 2].reshape(-1, 2).sum(axis=1)
+    negative = np.flatnonzero(pairs <= 0)
+    tau = -1.0 + 2.0 * pairs[: negative[0] if len(negative) else len(pairs)].sum()
+    return n / max(tau, 1.0 / n)
+
+
+class SampleMonitor:
+    """
+    Convergence of the ``nruns`` runs of one sample, updated as their
+    .t and .p files grow. After every sample that all runs have written,
+    the first ``burninfrac`` of the samples so far are discarded, and
+    the average standard deviation of split frequencies (ASDSF) across
+    runs and the smallest ESS of any .p column in any run are computed.
+    Once both meet the thresholds for ``consecutive`` samples in a row,
+    ``stopped_at`` is set to the generation of the last of them. The ESS
+    is only recomputed every ``ess_interval`` samples while the ASDSF
+    holds, so polling a long run does not take quadratic time; in between
+    the last value is used.
+    """
+
+    def __init__(self, prefix, nruns=2, burninfrac=0.0, thresholds=None, since=None):
+        self.prefix = str(prefix)
+        self.runs = [RunTrace(f"{prefix}.run{r}", since) for r in range(1, nruns + 1)]
+        self.burninfrac = burninfrac
+        self.thresholds = thresholds or Thresholds()
+        # Split counts of the samples between burnin and checked in every run
+        self.counts = [Counter() for _ in self.runs]
+        self.burnin = 0
+        self.checked = 0
+        self.streak = 0
+        self.asdsf = None
+        self.ess = None
+        # Value of checked when the ESS was last computed
+        self.ess_checked = 0
+        self.stopped_at = None
+
+    def split_frequency_sd(self) -> float:
+        kept = self.checked - self.burnin
+        if kept == 0 or len(self.runs) < 2:
+            return float("inf")
+        nruns = len(self.counts)
+        deviations = []
+        for split in set().union(*self.counts):
+            frequencies = [c[split] / kept for c in self.counts]
+            if max(frequencies) >= self.thresholds.min_partfreq:
+                mean = sum(frequencies) / nruns
+                variance = sum((f - mean) ** 2 for f in frequencies) / (nruns - 1)
+                deviations.append(sqrt(variance))
+        return sum(deviations) / len(deviations) if deviations else 0.0
+
+    def min_ess(self) -> float:
+        return min(
+            effective_sample_size(np.asarray(run.values[self.burnin : self.checked])[:, j])
+            for run in self.runs
+            for j in range(len(run.columns) - 1)
+        )
+
+    def poll(self) -> Optional[int]:
+        """Read what the runs wrote since the last call; returns ``stopped_at``."""
+        for run in self.runs:
+            run.poll()
+        available = min(len(run) for run in self.runs)
+        while self.stopped_at is None and self.checked < available:
+            for run, counts in zip(self.runs, self.counts):
+                counts.update(run.splits[self.checked])
+            self.checked += 1
+            burnin = int(self.checked * self.burninfrac)
+            while self.burnin < burnin:
+                for run, counts in zip(self.runs, self.counts):
+                    counts.subtract(run.splits[self.burnin])
+                self.burnin += 1
+
+            # The ESS is the expensive part, so it is only computed while the ASDSF holds
+            self.asdsf = self.split_frequency_sd()
+            if self.asdsf > self.thresholds.max_asdsf:
+                self.ess = None
+            elif (
+                self.ess is None
+                or self.checked - self.ess_checked >= self.thresholds.ess_interval
+            ):
+                self.ess = self.min_ess()
+                self.ess_checked = self.checked
+            if self.ess is not None and self.ess >= self.thresholds.min_ess:
+                self.streak += 1
+            else:
+                self.streak = 0
+            if self.streak >= self.thresholds.consecutive:
+                self.stopped_at = self.runs[0].generations[self.checked - 1]
+        return self.stopped_at
+
+
+# Cut a run's .t and .p files after the sample of ``generation`` and close the tree block
+def truncate_run(prefix, generation):
+    p_path = Path(f"{prefix}.p")
+    t_path = Path(f"{prefix}.t")
+    p_lines = []
+    for line in p_path.read_text(encoding="utf-8").splitlines(keepends=True):
+        first = line.split(None, 1)[0] if line.strip() else ""
+        if first.isdigit() and int(first) > generation:
+            break
+        p_lines.append(line)
+    t_lines = []
+    for line in t_path.read_text(encoding="utf-8").splitlines(keepends=True):
+        m = TREE_GENERATION.match(line.strip())
+        if (m and int(m.group(1)) > generation) or line.strip() == "end;":
+            break
+        t_lines.append(line)
+    t_lines.append("end;\n")
+    for path, lines in ((p_path, p_lines), (t_path, t_lines)):
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text("".join(lines), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Replay recorded MrBayes output and report where the monitor would have stopped each sample."
+    )
+    ap.add_argument(
+        "prefixes",
+        help="Sample file names without the .run<N>.t/.run<N>.p suffix.",
+        nargs="+",
+    )
+    ap.add_argument("--nruns", type=int, default=2)
+    ap.add_argument("--burninfrac", type=float, default=0.1)
+    defaults = Thresholds()
+    ap.add_argument("--max-asdsf", type=float, default=defaults.max_asdsf)
+    ap.add_argument("--min-ess", type=float, default=defaults.min_ess)
+    ap.add_argument("--consecutive", type=int, default=defaults.consecutive)
+    ap.add_argument("--min-partfreq", type=float, default=defaults.min_partfreq)
+    ap.add_argument("--ess-interval", type=int, default=defaults.ess_interval)
+    A = ap.parse_args()
+
+    thresholds = Thresholds(
+        max_asdsf=A.max_asdsf,
+        min_ess=A.min_ess,
+        consecutive=A.consecutive,
+        min_partfreq=A.min_partfreq,
+        ess_interval=A.ess_interval,
+    )
+    for prefix in A.prefixes:
+        monitor = SampleMonitor(prefix, A.nruns, A.burninfrac, thresholds)
+        stopped_at = monitor.poll()
+        if stopped_at is None:
+            print(
+                f"{prefix}: not converged after {monitor.checked} samples "
+                f"(ASDSF {monitor.asdsf}, min ESS {monitor.ess})."
+            )
+        else:
+            print(f"{prefix}: converged at generation {stopped_at}.")
+
+
+if __name__ == "__main__":
+    main()
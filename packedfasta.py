@@ -0,0 +1,218 @@
+#! /usr/bin/env python3
+
+import argparse
+from contextlib import ExitStack
+from pathlib import Path
+import struct
+
+import numpy as np
+
+from fastaio import iter_records, map_file
+
+# File layout (all integers little-endian):
+#   header:   magic "PFA2", version u32, ntax u32, reserved u32
+#   offsets:  ntax x u64, absolute offset of each record
+#   record:   header_len u32, nmask u32, nexc u32, reserved u32, seq_len u64,
+#             header (utf-8), mask starts/lengths (2 x nmask u64),
+#             exception starts/lengths (2 x nexc u64), exception bytes (nexc u8),
+#             ceil(seq_len / 4) bytes of 2-bit packed bases
+# Bases are coded A=0, C=1, G=2, T=3, four per byte starting at the high bits.
+# Lower-case stretches are stored as mask runs, and runs of any other
+# character (gaps, N, IUPAC codes) as exception runs; both are applied on
+# top of the decoded bases.
+MAGIC = b"PFA2"
+VERSION = 1
+SUFFIX = ".pfa"
+FILE_HEADER = struct.Struct("<4sIII")
+RECORD_HEADER = struct.Struct("<IIIIQ")
+
+CODES = np.full(256, 255, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    CODES[base] = code
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+# The four bases encoded by each possible packed byte
+DECODE = BASES[(np.arange(256, dtype=np.uint8)[:, None] >> SHIFTS) & 3]
+LOWER = np.zeros(256, dtype=bool)
+LOWER[ord("a") : ord("z") + 1] = True
+
+
+# Command line arguments
+def readArguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--inFile",
+        type=str,
+        nargs="+",
+        required=True,
+        help="FASTA file(s) to pack. Each is written next to the input with the .pfa extension.",
+    )
+    parser.add_argument(
+        "--unpack",
+        action="store_true",
+        help="Convert packed .pfa file(s) back to FASTA instead.",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def is_packed(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# Returns (start, length) of every run of True values
+def _runs(flags):
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], flags, [False]))))
+    return edges[0::2], edges[1::2] - edges[0::2]
+
+
+def pack_record(header, seq):
+    """Encode one record (``header`` str, ``seq`` bytes) in the packed record layout."""
+    raw = np.frombuffer(seq, dtype=np.uint8)
+    lower = LOWER[raw]
+    upper = np.where(lower, raw - 32, raw).astype(np.uint8)
+    mask_starts, mask_lengths = _runs(lower)
+
+    codes = CODES[upper]
+    exception = codes == 255
+    # A new exception run starts wherever the character changes
+    change = np.ones(raw.size, dtype=bool)
+    change[1:] = upper[1:] != upper[:-1]
+    exc_starts = np.flatnonzero(exception & (change | ~np.roll(exception, 1)))
+    exc_ends = np.append(exc_starts[1:], raw.size)
+    # Cut each run at the first position that is no longer an exception
+    not_exc = np.flatnonzero(~exception)
+    cut = np.searchsorted(not_exc, exc_starts)
+    exc_ends = np.minimum(exc_ends, np.append(not_exc, raw.size)[cut])
+    exc_bytes = upper[exc_starts]
+
+    codes = np.where(exception, 0, codes).astype(np.uint8)
+    padded = np.zeros(-(-raw.size // 4) * 4, dtype=np.uint8)
+    padded[: raw.size] = codes
+    packed = np.bitwise_or.reduce(padded.reshape(-1, 4) << SHIFTS, axis=1).astype(
+        np.uint8
+    )
+
+    name = header.encode("utf-8")
+    return b"".join(
+        [
+            RECORD_HEADER.pack(len(name), mask_starts.size, exc_starts.size, 0, raw.size),
+            name,
+            mask_starts.astype("<u8").tobytes(),
+            mask_lengths.astype("<u8").tobytes(),
+            exc_starts.astype("<u8").tobytes(),
+            (exc_ends - exc_starts).astype("<u8").tobytes(),
+            exc_bytes.tobytes(),
+            packed.tobytes(),
+        ]
+    )
+
+
+def write_packed(path, records):
+    """Write ``(header, sequence)`` pairs to ``path`` in the packed format."""
+    records = list(records)
+    with open(path, "wb") as out:
+        out.write(FILE_HEADER.pack(MAGIC, VERSION, len(records), 0))
+        # The offset table is filled in once all records have been streamed out
+        table_offset = out.tell()
+        out.write(bytes(8 * len(records)))
+        offsets = []
+        for header, seq in records:
+            if isinstance(seq, str):
+                seq = seq.encode("ascii")
+            offsets.append(out.tell())
+            out.write(pack_record(header, seq))
+        out.seek(table_offset)
+        out.write(np.array(offsets, dtype="<u8").tobytes())
+
+
+class PackedFasta:
+    """
+    Read-only, memory-mapped view of a packed file. Records are decoded
+    on access, so any record can be read without touching the others.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._stack = ExitStack()
+        self._buf = self._stack.enter_context(map_file(self.path))
+        magic, version, ntax, _ = FILE_HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise Exception(f"{self.path} is not a packed FASTA file")
+        self._offsets = np.frombuffer(
+            self._buf, dtype="<u8", count=ntax, offset=FILE_HEADER.size
+        ).tolist()
+
+    def close(self):
+        self._buf = None
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def header(self, i):
+        name_len = RECORD_HEADER.unpack_from(self._buf, self._offsets[i])[0]
+        start = self._offsets[i] + RECORD_HEADER.size
+        return self._buf[start : start + name_len].decode("utf-8")
+
+    def sequence(self, i) -> bytes:
+        offset = self._offsets[i]
+        name_len, nmask, nexc, _, seq_len = RECORD_HEADER.unpack_from(self._buf, offset)
+        pos = offset + RECORD_HEADER.size + name_len
+
+        def take(dtype, count):
+            nonlocal pos
+            values = np.frombuffer(self._buf, dtype=dtype, count=count, offset=pos)
+            pos += values.nbytes
+            return values.astype(np.int64)
+
+        mask_starts, mask_lengths = take("<u8", nmask), take("<u8", nmask)
+        exc_starts, exc_lengths = take("<u8", nexc), take("<u8", nexc)
+        exc_bytes = take(np.uint8, nexc).astype(np.uint8)
+        packed = np.frombuffer(self._buf, dtype=np.uint8, count=-(-seq_len // 4), offset=pos)
+
+        seq = DECODE[packed].reshape(-1)[:seq_len]
+        if nexc:
+            seq[_expand(exc_starts, exc_lengths)] = np.repeat(exc_bytes, exc_lengths)
+        if nmask:
+            masked = _expand(mask_starts, mask_lengths)
+            seq[masked] += 32
+        return seq.tobytes()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.header(i), self.sequence(i)
+
+
+# Positions covered by a list of (start, length) runs
+def _expand(starts, lengths):
+    total = int(lengths.sum())
+    run_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return run_offsets + np.arange(total)
+
+
+def main(args):
+    for f in args.inFile:
+        f = Path(f)
+        if args.unpack:
+            with PackedFasta(f) as packed, open(f.with_suffix(".fasta"), "wb") as out:
+                for header, seq in packed:
+                    out.write(b">" + header.encode("utf-8") + b"\n" + seq + b"\n")
+        else:
+            with map_file(f) as buf:
+                write_packed(f.with_suffix(SUFFIX), iter_records(buf))
+    print(f"{len(args.inFile)} files converted.")
+    return
+
+
+if __name__ == "__main__":
+    args = readArguments()
+    main(args)
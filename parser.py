@@ -1,30 +1,140 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import json
-import re
-import io
 import pandas as pd
 from pathlib import Path
+import sys
 from typing import List
 
+import attr
+
+from bipartitions import COLUMNS, ESTIMATOR, information_table
+from catalog import Catalog
+from resultstore import ResultStore, galax_stats
+from samplefiles import sample_tree_files
+
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("inpath", help="Input JSON parameters files.", type=Path, nargs="*")
+    ap.add_argument(
+        "inpath",
+        help="Input JSON parameters files, or directories to search for parameters.json files.",
+        type=Path,
+        nargs="*",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        help="Number of worker processes parsing parameter files in parallel.",
+        type=int,
+        default=1,
+    )
+    ap.add_argument(
+        "--store",
+        help="SQLite results store. Only parameter files whose galax outputs are new or changed are parsed; their rows are upserted, and the output is read back from the store.",
+        type=Path,
+    )
+    ap.add_argument(
+        "--catalog",
+        help="Experiment catalog written by generatev2.py. Its runs are parsed in addition to INPATH, and with --store only rows of cataloged runs are output.",
+        type=Path,
+    )
+    ap.add_argument(
+        "--freq",
+        help="Only output rows with this param.origin.freq (requires --store or --catalog).",
+    )
+    ap.add_argument(
+        "--prefix",
+        help="Only output rows with this param.origin.prefix (requires --store or --catalog).",
+    )
+    ap.add_argument(
+        "--native",
+        help="Compute the information table from the MrBayes .t files directly instead of reading galax output. These are bipartitions.py's CCD estimates, which are not galax-equivalent, so they are written to the native_information column instead of galax_information.",
+        action="store_true",
+    )
+    ap.add_argument(
+        "--output", "-o", help="CSV file to write.", type=Path, default=Path("test.csv")
+    )
     A = ap.parse_args()
-
-    rows = []
-    for parameters_json in A.inpath:
-        rows.extend(process_parameter(parameters_json))
+    if (A.freq is not None or A.prefix is not None) and (
+        A.store is None and A.catalog is None
+    ):
+        ap.error("--freq and --prefix require --store or --catalog")
+
+    parameter_files = find_parameter_files(A.inpath)
+    if A.catalog is not None:
+        with Catalog(A.catalog) as catalog:
+            parameter_files.extend(catalog.parameter_files(freq=A.freq, prefix=A.prefix))
+        # Folders given on the command line may be cataloged as well
+        parameter_files = list({f.resolve(): f for f in parameter_files}.values())
+    if A.store is not None:
+        with ResultStore(A.store) as store:
+            stale = [f for f in parameter_files if store.is_stale(f, A.native)]
+            stale, stats = with_results(stale, A.native)
+            results = process_parameters(stale, A.jobs, A.native)
+            for f, s, result in zip(stale, stats, results):
+                store.upsert(f, result, s)
+            print(f"Parsed {len(stale)} of {len(parameter_files)} parameter files.")
+            rows = store.query(freq=A.freq, prefix=A.prefix, catalog=A.catalog)
+    else:
+        rows = []
+        parameter_files, _ = with_results(parameter_files, A.native)
+        for result in process_parameters(parameter_files, A.jobs, A.native):
+            rows.extend(
+                row
+                for row in result
+                if A.freq in (None, row.get("param.origin.freq"))
+                and A.prefix in (None, row.get("param.origin.prefix"))
+            )
 
     # pass in list of dicts to DataFrame constructor
     df = pd.DataFrame(rows)
     print(df)
-    df.to_csv("test.csv")
+    df.to_csv(A.output)
+
+
+def find_parameter_files(paths) -> List[Path]:
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.rglob("parameters.json")))
+        else:
+            files.append(path)
+    return files
+
+
+# The parameter files whose galax outputs (or .t files) all exist, and their galax_stats; the others are skipped with a warning
+def with_results(parameter_files, native=False):
+    files = []
+    stats = []
+    for f in parameter_files:
+        s = galax_stats(f, native)
+        if s is None:
+            sources = "tree files" if native else "galax output"
+            print(f"Skipping {f}: its {sources} is missing.", file=sys.stderr)
+            continue
+        files.append(f)
+        stats.append(s)
+    return files, stats
+
+
+def process_parameters(parameter_files, jobs=1, native=False):
+    """
+    Run ``process_parameter`` on every file, in a process pool if
+    ``jobs > 1``. Results are returned in the order of the input files.
+    """
+    process = partial(process_parameter, native=native)
+    if jobs > 1 and len(parameter_files) > 1:
+        chunksize = max(1, len(parameter_files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(process, parameter_files, chunksize=chunksize))
+    return [process(f) for f in parameter_files]
 
 
-def process_parameter(parameters_json: Path) -> List[dict]:
+def process_parameter(parameters_json: Path, native=False) -> List[dict]:
     """
     Read ``parameter.json`` and parse the galax output files in the
     directory. Return a list of dictionaries corresponding to each of
@@ -33,6 +143,12 @@ def process_parameter(parameters_json: Path) -> List[dict]:
     Each dictionary contains the the "galax_information" and
     "file_index" keys, as well as a ``param.whatever`` key for each of
     the ``whatever`` keys in the ``parameters.json``.
+
+    With ``native``, the table is computed from the sample's ``.t`` files
+    by ``bipartitions`` instead of being read from the galax output. Its
+    values are estimates that are not galax-equivalent, so they go into
+    "native_information" instead of "galax_information", and every row
+    records where its value came from in ``information_source``.
     """
     meta = json.loads(parameters_json.read_text(encoding="utf-8"))
 
@@ -43,34 +159,81 @@ def process_parameter(parameters_json: Path) -> List[dict]:
     for index, input_file_name in enumerate(meta["inputs"], 1):
         # we don't actually do anything with input_file_name
 
-        # parse in galax information metric output
-        galax_output_path = parameters_json.parent / f"samp{index}merged.txt"
-        df = parse_galax_information_table_output(
-            galax_output_path.read_text(encoding="utf-8")
-        )
+        if native:
+            table = native_information_table(parameters_json.parent, meta, index)
+        else:
+            # parse in galax information metric output
+            galax_output_path = parameters_json.parent / f"samp{index}merged.txt"
+            table = parse_galax_information_table_output(
+                galax_output_path.read_text(encoding="utf-8")
+            )
 
         # create information for this row by copying parameters dict
         rowdata = basedict.copy()
-        rowdata["galax_information"] = df.iloc[2, 6]
+        # Estimates get their own column, so nothing selecting galax_information picks them up
+        rowdata["native_information" if native else "galax_information"] = table.rows[2][6]
         rowdata["file_index"] = index
+        rowdata["information_source"] = ESTIMATOR if native else "galax"
         result.append(rowdata)
 
     return result
 
 
-def parse_galax_information_table_output(text):
-    m = re.search("\n\n" r"(\s*treefile)\s+unique\s+coverage", text)
-    assert m, "Can't find table."
-    first_column_length = m.end(1) - m.start(1)
-    table_lines = []
-    for line in text[m.start(1) :].split("\n"):
+@attr.s
+class GalaxTable:
+    columns: List[str] = attr.ib()
+    rows: List[list] = attr.ib()
+
+    def column(self, name) -> list:
+        i = self.columns.index(name)
+        return [row[i] for row in self.rows]
+
+
+def _typed(value: str):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_galax_information_table_output(text) -> GalaxTable:
+    """
+    Extract the table that follows a blank line and starts with the
+    ``treefile unique coverage`` header. Spaces inside the (fixed-width)
+    first column are replaced by ``_``, and the other cells are converted
+    to int or float where possible.
+    """
+    lines = text.split("\n")
+    for start, line in enumerate(lines):
+        if (
+            start > 0
+            and not lines[start - 1]
+            and line.split()[:3] == ["treefile", "unique", "coverage"]
+        ):
+            break
+    else:
+        raise ValueError("Can't find table.")
+
+    first_column_length = lines[start].index("treefile") + len("treefile")
+    columns = lines[start].split()
+    rows = []
+    for line in lines[start + 1 :]:
         if not line:
             break
-        line = "_".join(line[:first_column_length].split()) + line[first_column_length:]
-        table_lines.append(line)
-    print(table_lines)
-    df = pd.read_table(io.StringIO("\n".join(table_lines)), sep=r"\s+")
-    return df
+        name = "_".join(line[:first_column_length].split())
+        rows.append([name] + [_typed(v) for v in line[first_column_length:].split()])
+    return GalaxTable(columns=columns, rows=rows)
+
+
+# Table in galax' layout, estimated in-process from the sample's tree files
+def native_information_table(folder: Path, meta, index) -> GalaxTable:
+    rows = information_table(
+        [folder / t for t in sample_tree_files(meta, index)],
+        float(meta.get("mcmc.burninfrac", 0.0)),
+    )
+    return GalaxTable(columns=list(COLUMNS), rows=[list(attr.astuple(r)) for r in rows])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from pathlib import Path
+import sqlite3
+from typing import List, Optional
+
+from samplefiles import sample_tree_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    parameters_path TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    galax_mtime_ns INTEGER NOT NULL,
+    galax_size INTEGER NOT NULL,
+    origin_freq TEXT,
+    origin_prefix TEXT,
+    galax_information REAL,
+    row_json TEXT NOT NULL,
+    PRIMARY KEY (parameters_path, file_index)
+);
+CREATE INDEX IF NOT EXISTS results_origin ON results (origin_freq, origin_prefix);
+CREATE INDEX IF NOT EXISTS results_prefix ON results (origin_prefix);
+"""
+
+
+def galax_output_path(parameters_json: Path, index: int) -> Path:
+    return parameters_json.parent / f"samp{index}merged.txt"
+
+
+# Files a sample's results are computed from: its galax output, or its .t files if they are read natively
+def result_sources(parameters_json: Path, meta, index, native=False) -> List[Path]:
+    if native:
+        return [parameters_json.parent / t for t in sample_tree_files(meta, index)]
+    return [galax_output_path(parameters_json, index)]
+
+
+# (mtime_ns, size) of the sources of every sample of a parameters.json, or None if one is missing
+def galax_stats(parameters_json: Path, native=False) -> Optional[List[tuple]]:
+    meta = json.loads(parameters_json.read_text(encoding="utf-8"))
+    stats = []
+    for index in range(1, len(meta["inputs"]) + 1):
+        try:
+            sources = [
+                os.stat(path)
+                for path in result_sources(parameters_json, meta, index, native)
+            ]
+        except FileNotFoundError:
+            return None
+        stats.append(
+            (max(s.st_mtime_ns for s in sources), sum(s.st_size for s in sources))
+        )
+    return stats
+
+
+class ResultStore:
+    """
+    SQLite table of parsed galax results with one row per sample. Rows
+    are keyed by the resolved ``parameters.json`` path and remember the
+    mtime and size of the galax output (or tree files) they were parsed
+    from, so only new or changed folders have to be parsed again.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_stale(self, parameters_json: Path, native=False) -> bool:
+        stats = galax_stats(parameters_json, native)
+        stored = self.db.execute(
+            "SELECT galax_mtime_ns, galax_size FROM results"
+            " WHERE parameters_path = ? ORDER BY file_index",
+            (str(parameters_json.resolve()),),
+        ).fetchall()
+        return stats is None or stored != stats
+
+    def upsert(self, parameters_json: Path, rows: List[dict], stats: List[tuple]):
+        key = str(parameters_json.resolve())
+        with self.db:
+            self.db.execute("DELETE FROM results WHERE parameters_path = ?", (key,))
+            self.db.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        row["file_index"],
+                        mtime_ns,
+                        size,
+                        row.get("param.origin.freq"),
+                        row.get("param.origin.prefix"),
+                        # NULL for rows of native estimates
+                        row.get("galax_information"),
+                        json.dumps(row),
+                    )
+                    for row, (mtime_ns, size) in zip(rows, stats)
+                ],
+            )
+
+    def query(self, freq=None, prefix=None, catalog=None) -> List[dict]:
+        """
+        Return the stored rows, optionally only those of one origin.freq
+        and/or origin.prefix. With the path of an experiment ``catalog``,
+        only rows of runs registered in it are returned.
+        """
+        conditions = []
+        values = []
+        if freq is not None:
+            conditions.append("results.origin_freq = ?")
+            values.append(freq)
+        if prefix is not None:
+            conditions.append("results.origin_prefix = ?")
+            values.append(prefix)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        join = ""
+        if catalog is not None:
+            self.db.execute("ATTACH DATABASE ? AS catalog", (str(catalog),))
+            join = " JOIN catalog.runs USING (parameters_path)"
+        try:
+            cursor = self.db.execute(
+                f"SELECT row_json FROM results{join}{where}"
+                " ORDER BY parameters_path, file_index",
+                values,
+            )
+            return [json.loads(row_json) for (row_json,) in cursor]
+        finally:
+            if catalog is not None:
+                self.db.execute("DETACH DATABASE catalog")
@@ -1,96 +1,796 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 from pathlib import Path
-from subprocess import check_call
+from subprocess import CalledProcessError, Popen, TimeoutExpired
+import sys
+import tempfile
+import threading
+
+from catalog import DONE, FAILED, Catalog, run_record
+from convcache import ConversionCache
+import fasta_to_nexus
+import mbblock_maker
+from monitor import SampleMonitor, Thresholds, truncate_run
+from samplefiles import mb_outputs, sample_files, sample_tree_files
+from stagecache import StageCache, params_with_prefix
+import tracing
 
 # https://creativecommons.org/share-your-work/public-domain/cc0/
 
 
-def strip_suffix(string: str, suffix: str) -> str:
-    assert string.endswith(suffix)
-    return string[: -len(suffix)]
+def read_meta(folder: Path):
+    return json.loads((folder / "parameters.json").read_text(encoding="utf-8"))
+
+
+# The mcmc.* keys of parameters.json are the mbblock_maker parameters
+def mbblock_params(meta) -> dict:
+    params = {}
+    for key, value in meta.items():
+        _, sep, name = key.partition("mcmc.")
+        if sep and name:
+            params[name] = value
+    return params
+
+
+# Nexus files of each mb shard if parameters.json sets mb.shards (a number, or "sample" for one per sample)
+def mb_shards(folder: Path, meta):
+    shards = meta.get("mb.shards")
+    if shards is None:
+        return None
+    _, nexus_files = sample_files(meta)
+    nshards = len(nexus_files) if shards == "sample" else int(shards)
+    costs = mbblock_maker.block_costs(
+        [folder / nexus_file_name for nexus_file_name in nexus_files], mbblock_params(meta)
+    )
+    return [
+        [nexus_files[i] for i in shard]
+        for shard in mbblock_maker.balance_shards(costs, nshards)
+    ]
+
+
+def shard_block(k):
+    return f"mbblock.shard{k}.nexus"
+
+
+# Cores one mb process keeps busy: a chain per core
+def mb_cores(meta):
+    return int(meta.get("mcmc.nchains", 4)) * int(meta.get("mcmc.nruns", 2))
+
+
+# Every shard gets one, as balance_shards only leaves shards empty if there are more shards than samples
+def shard_blocks(meta):
+    shards = meta.get("mb.shards")
+    if shards is None:
+        return []
+    nsamples = len(meta["inputs"])
+    nshards = nsamples if shards == "sample" else min(int(shards), nsamples)
+    return [shard_block(k) for k in range(1, nshards + 1)]
+
+
+# Copy the outputs of conversions done before from conv_cache and return the conversions left to do
+def cached_conversions(folder: Path, cache, conv_cache, params, conversions, force):
+    """
+    ``conversions`` are ``(input, {kind: output})`` pairs, each output
+    being cached under its kind. An input counts as converted only if
+    all of its outputs are cached. Returns the remaining conversions as
+    ``(input, [(output, key)])``, the key being None without a cache.
+    """
+    pending = []
+    for input_name, outputs in conversions:
+        keys = dict.fromkeys(outputs)
+        if conv_cache is not None:
+            digest = cache.file_digest(input_name)
+            keys = {kind: conv_cache.key(kind, params, digest) for kind in outputs}
+            if not force and all(
+                conv_cache.fetch(keys[kind], folder / output_name)
+                for kind, output_name in outputs.items()
+            ):
+                continue
+        # The converters truncate and rewrite an existing target in place, so each
+        # output is removed first and written as a new file, never through an
+        # inode another path may share
+        for output_name in outputs.values():
+            (folder / output_name).unlink(missing_ok=True)
+        pending.append(
+            (input_name, [(output_name, keys[kind]) for kind, output_name in outputs.items()])
+        )
+    return pending
+
+
+def prepare(folder: Path, meta, jobs=1, force=False, conv_cache=None):
+    """
+    Generate the MrBayes inputs of one MCMC folder: the converted FASTA
+    files, their NEXUS versions and ``mbblock.nexus``. All paths are
+    resolved against ``folder``, so the working directory is left alone.
+    Stages whose inputs and parameters are unchanged are skipped unless
+    ``force`` is set. With a ``ConversionCache``, samples whose contents
+    were converted before, in this or another folder, are copied from it.
+
+    If ``charconverter.map`` holds the character mapping, the inputs are
+    converted and written as NEXUS in a single pass, and the converted
+    FASTA files are only written if ``charconverter.write_conv`` is set.
+    """
+    conv_files, nexus_files = sample_files(meta)
+    cache = StageCache(folder)
+    insert_gap_at = meta["fasta_to_nexus.insert_gap_at"]
+    interleave = meta.get("fasta_to_nexus.interleave")
+
+    def store(pending):
+        for _, outputs in pending:
+            for output_name, key in outputs:
+                if key is not None:
+                    conv_cache.store(key, folder / output_name)
+
+    def check_results(results):
+        failed = [r for r in results if r.error is not None]
+        if failed:
+            raise Exception(
+                "; ".join(f"Failed to convert {r.path}: {r.error}" for r in failed)
+            )
+
+    def convert_characters():
+        pending = cached_conversions(
+            folder,
+            cache,
+            conv_cache,
+            params_with_prefix(meta, "charconverter."),
+            [(i, {"conv": c}) for i, c in zip(meta["inputs"], conv_files)],
+            force,
+        )
+        if not pending:
+            return
+        # charconverter.py is not part of this repository, so it still runs as a helper script
+        tracing.check_call(
+            ["charconverter.py", "--inFile"] + [name for name, _ in pending],
+            cwd=str(folder),
+        )
+        store(pending)
+
+    def convert_to_nexus():
+        pending = cached_conversions(
+            folder,
+            cache,
+            conv_cache,
+            params_with_prefix(meta, "fasta_to_nexus."),
+            [(c, {"nexus": n}) for c, n in zip(conv_files, nexus_files)],
+            force,
+        )
+        if not pending:
+            return
+        check_results(
+            fasta_to_nexus.convert_files(
+                [str(folder / name) for name, _ in pending],
+                insert_gap_at,
+                jobs,
+                interleave=interleave,
+            )
+        )
+        store(pending)
+
+    write_conv = bool(meta.get("charconverter.write_conv", False))
+    fused_outputs = nexus_files + conv_files if write_conv else nexus_files
+    fused_params = dict(
+        params_with_prefix(meta, "charconverter."),
+        **params_with_prefix(meta, "fasta_to_nexus."),
+    )
+
+    def convert_fused():
+        table = fasta_to_nexus.char_table(meta["charconverter.map"])
+        conversions = []
+        for input_name, conv_name, nexus_name in zip(meta["inputs"], conv_files, nexus_files):
+            outputs = {"fused": nexus_name}
+            if write_conv:
+                outputs["fused conv"] = conv_name
+            conversions.append((input_name, outputs))
+        pending = cached_conversions(folder, cache, conv_cache, fused_params, conversions, force)
+        if not pending:
+            return
+        check_results(
+            fasta_to_nexus.convert_files_fused(
+                [
+                    (
+                        folder / input_name,
+                        folder / outputs[0][0],
+                        folder / outputs[1][0] if write_conv else None,
+                    )
+                    for input_name, outputs in pending
+                ],
+                table,
+                insert_gap_at,
+                jobs,
+                interleave,
+            )
+        )
+        store(pending)
+
+    def write_mbblock():
+        params = mbblock_params(meta)
+        print("Writing mbblock with parameters", params)
+        with open(folder / "mbblock.nexus", "w") as mbblocks:
+            mbblock_maker.write_blocks(nexus_files, params, mbblocks)
+        shards = mb_shards(folder, meta)
+        if shards is not None:
+            index = {name: i for i, name in enumerate(nexus_files)}
+            mbblock_maker.write_shards(
+                nexus_files,
+                params,
+                [[index[name] for name in shard] for shard in shards],
+                lambda k: folder / shard_block(k),
+            )
+            print(f"Split the samples into {len(shards)} mb shards.")
+
+    if "charconverter.map" in meta:
+        cache.run("fused", meta["inputs"], fused_params, fused_outputs, convert_fused, force)
+    else:
+        cache.run(
+            "conv",
+            meta["inputs"],
+            params_with_prefix(meta, "charconverter."),
+            conv_files,
+            convert_characters,
+            force,
+        )
+        cache.run(
+            "nexus",
+            conv_files,
+            params_with_prefix(meta, "fasta_to_nexus."),
+            nexus_files,
+            convert_to_nexus,
+            force,
+        )
+    # Shards are balanced by the dimensions of the NEXUS files, so they depend on their contents
+    cache.run(
+        "mbblock",
+        nexus_files if "mb.shards" in meta else [],
+        dict(
+            params_with_prefix(meta, "mcmc."),
+            **params_with_prefix(meta, "mb."),
+            inputs=nexus_files,
+        ),
+        ["mbblock.nexus"] + shard_blocks(meta),
+        write_mbblock,
+        force,
+    )
+
+
+# Prepares every MCMC folder below root in this process, carrying on past failing folders
+def prepare_all(root: Path, jobs=1, force=False, conv_cache=None):
+    failed = 0
+    parameter_files = sorted(root.rglob("parameters.json"))
+    for parameters_json in parameter_files:
+        folder = parameters_json.parent
+        try:
+            meta = json.loads(parameters_json.read_text(encoding="utf-8"))
+            with tracing.span("prepare", folder=str(folder)):
+                prepare(folder, meta, jobs, force, conv_cache)
+        except Exception as e:
+            failed += 1
+            print(f"Failed to prepare {folder}: {e}", file=sys.stderr)
+        else:
+            print(f"Prepared {folder}.")
+    print(f"{len(parameter_files) - failed} of {len(parameter_files)} folders prepared.")
+    return failed
+
+
+FINISHED = "finished"
+PARTIAL = "partial"
+NOT_STARTED = "not started"
+
+# Where the monitor records the generation it stopped each sample at. This is
+# run state, so it is kept out of parameters.json and the experiment's identity
+MONITOR_NAME = "monitor.json"
+
+# Serializes the monitor.json updates of concurrently monitored shards
+MONITOR_LOCK = threading.Lock()
+
+
+# {nexus file: generation} of the samples the monitor stopped early
+def read_stopped_at(folder: Path) -> dict:
+    try:
+        monitor_state = json.loads((folder / MONITOR_NAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    return monitor_state["stopped_at_generation"]
+
+
+def write_stopped_at(folder: Path, stopped_at):
+    tmp_path = folder / f"{MONITOR_NAME}.{os.getpid()}.tmp"
+    tmp_path.write_text(
+        json.dumps({"stopped_at_generation": stopped_at}, indent=2), encoding="utf-8"
+    )
+    os.replace(tmp_path, folder / MONITOR_NAME)
+
+
+# Generation of the last sample in a .p file, or None if there is none
+def last_generation(p_path: Path):
+    try:
+        with open(p_path, "rb") as p_file:
+            p_file.seek(max(0, p_file.seek(0, os.SEEK_END) - 4096))
+            lines = p_file.read().split(b"\n")
+    except OSError:
+        return None
+    for line in reversed(lines):
+        if line.strip():
+            try:
+                return int(line.split(None, 1)[0])
+            except ValueError:
+                return None
+    return None
+
+
+def tree_file_complete(t_path: Path) -> bool:
+    try:
+        with open(t_path, "rb") as t_file:
+            t_file.seek(max(0, t_file.seek(0, os.SEEK_END) - 256))
+            return b"end;" in t_file.read()
+    except OSError:
+        return False
+
+
+# The value of an mcmc.* parameter for one sample, which may be given per sample as a list
+def sample_param(meta, key, nexus_file_name):
+    value = meta[key]
+    if isinstance(value, (list, tuple)):
+        if len(value) == 1:
+            return value[0]
+        _, nexus_files = sample_files(meta)
+        return value[nexus_files.index(nexus_file_name)]
+    return value
+
+
+# Files mb writes for a sample besides its .t and .p files, which say how far it got
+MB_STATE_SUFFIXES = (".ckp", ".ckp~", ".mcmc")
+
+
+# Removes what mb wrote for every sample, so a run that starts over cannot
+# later take outputs of earlier inputs for finished or resumable samples
+def clear_mb_outputs(folder: Path, meta):
+    _, nexus_files = sample_files(meta)
+    names = mb_outputs(meta) + [
+        f"{nexus_file_name}{suffix}"
+        for nexus_file_name in nexus_files
+        for suffix in MB_STATE_SUFFIXES
+    ]
+    for name in names:
+        (folder / name).unlink(missing_ok=True)
+
+
+# Classifies one sample from the .p, .t and .ckp files mb left in the folder
+def sample_status(folder: Path, nexus_file_name, meta, stopped_at=None) -> str:
+    # A sample the monitor stopped early is finished at that generation
+    if stopped_at is None:
+        stopped_at = read_stopped_at(folder)
+    ngen = int(
+        stopped_at.get(nexus_file_name, sample_param(meta, "mcmc.ngen", nexus_file_name))
+    )
+    nruns = int(meta.get("mcmc.nruns", 2))
+    if all(
+        (last_generation(folder / f"{nexus_file_name}.run{r}.p") or -1) >= ngen
+        and tree_file_complete(folder / f"{nexus_file_name}.run{r}.t")
+        for r in range(1, nruns + 1)
+    ):
+        return FINISHED
+    if (folder / f"{nexus_file_name}.ckp").exists():
+        return PARTIAL
+    return NOT_STARTED
+
+
+# (nexus file, status) of every sample (or of the given nexus files) that has not finished yet
+def pending_samples(folder: Path, meta, nexus_files=None):
+    if nexus_files is None:
+        _, nexus_files = sample_files(meta)
+    pending = []
+    stopped_at = read_stopped_at(folder)
+    for nexus_file_name in nexus_files:
+        status = sample_status(folder, nexus_file_name, meta, stopped_at)
+        if status == FINISHED:
+            print(f"{folder}: {nexus_file_name} is finished, skipping it.")
+        elif status == PARTIAL:
+            print(f"{folder}: {nexus_file_name} is resumed from its checkpoint.")
+        else:
+            print(f"{folder}: {nexus_file_name} is started from generation 0.")
+        if status != FINISHED:
+            pending.append((nexus_file_name, status))
+    return pending
+
+
+def write_resume_block(folder: Path, meta, pending, name="resume.nexus"):
+    """
+    Write ``name`` with a block for every pending sample. Samples
+    with a checkpoint continue from it with ``append=yes``; the others
+    start from generation zero. Returns the block's file name, or None if
+    every sample is finished.
+    """
+    if not pending:
+        return None
+
+    _, nexus_files = sample_files(meta)
+    params = mbblock_maker.select_params(
+        mbblock_params(meta),
+        [nexus_files.index(n) for n, _ in pending],
+        len(nexus_files),
+    )
+    params["append"] = ["yes" if status == PARTIAL else "no" for _, status in pending]
+    with open(folder / name, "w") as resume:
+        mbblock_maker.write_blocks([n for n, _ in pending], params, resume)
+    return name
+
+
+# Runs MrBayes on the folder's mbblock.nexus, or its shards concurrently, unless its outputs are up to date, and returns the exit status.
+# With cores, only as many shards run at once as their chains fit in, and at least one
+def run(
+    folder: Path,
+    meta=None,
+    mb="mb",
+    stdin=None,
+    stdout=None,
+    force=False,
+    monitor=False,
+    poll_interval=10.0,
+    cores=None,
+):
+    if meta is None:
+        meta = read_meta(folder)
+    _, nexus_files = sample_files(meta)
+    cache = StageCache(folder)
+    inputs = ["mbblock.nexus"] + shard_blocks(meta) + nexus_files
+    outputs = mb_outputs(meta)
+
+    fingerprint = cache.fingerprint(inputs, {})
+    if not force and cache.is_fresh("mb", fingerprint, outputs):
+        print(f"Stage mb in {folder} is up to date.")
+        return 0
+    cache.invalidate("mb")
+
+    # Outputs left by an interrupted run on the same inputs can be resumed,
+    # anything else starts over without the outputs of earlier runs
+    resume = not force and cache.is_fresh("mb.started", fingerprint, [])
+    if resume:
+        pending = pending_samples(folder, meta)
+    else:
+        pending = [(nexus_file_name, NOT_STARTED) for nexus_file_name in nexus_files]
+        clear_mb_outputs(folder, meta)
+        (folder / MONITOR_NAME).unlink(missing_ok=True)
+        cache.record("mb.started", fingerprint, [])
+
+    # (block, pending samples, resume block name) of every mb process to run
+    shards = mb_shards(folder, meta)
+    if shards is None:
+        groups = [(nexus_files, "mbblock.nexus", "resume.nexus")]
+    else:
+        groups = [
+            (shard, shard_block(k), f"resume.shard{k}.nexus")
+            for k, shard in enumerate(shards, 1)
+        ]
+    jobs = []
+    for group, block, resume_name in groups:
+        group_pending = [(name, status) for name, status in pending if name in group]
+        if resume:
+            block = write_resume_block(folder, meta, group_pending, resume_name)
+        if block is not None:
+            jobs.append((block, group_pending, resume_name))
+
+    def run_block(job):
+        block, group_pending, resume_name = job
+        if monitor:
+            return run_monitored(
+                folder,
+                meta,
+                block,
+                group_pending,
+                mb,
+                stdin,
+                stdout,
+                poll_interval,
+                resume_name,
+            )
+        return tracing.call(
+            [mb, block], cwd=str(folder), stdin=stdin, stdout=stdout, stderr=stdout
+        )
+
+    workers = len(jobs) if cores is None else max(1, min(len(jobs), cores // mb_cores(meta)))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            returncodes = list(pool.map(run_block, jobs))
+    else:
+        returncodes = [run_block(job) for job in jobs]
+    returncode = next((r for r in returncodes if r), 0)
+    if returncode:
+        return returncode
+    cache.record("mb", fingerprint, outputs)
+    return 0
+
+
+# The current time of the clock that stamps the modification times of files in
+# folder, which can lag time.time_ns() by a few milliseconds
+def filesystem_time_ns(folder: Path) -> int:
+    with tempfile.TemporaryFile(dir=folder) as f:
+        return os.fstat(f.fileno()).st_mtime_ns
+
+
+def run_monitored(
+    folder: Path,
+    meta,
+    block,
+    pending,
+    mb,
+    stdin,
+    stdout,
+    poll_interval,
+    resume_name="resume.nexus",
+):
+    """
+    Run mb on ``block`` while a ``SampleMonitor`` follows every pending
+    sample. When one converges, mb is terminated, the sample's files are
+    cut after the generation it converged at, that generation is
+    recorded in ``monitor.json``, and mb is started again on the
+    resume block ``resume_name`` for the samples still pending. Returns
+    mb's exit status.
+    """
+    samples = [nexus_file_name for nexus_file_name, _ in pending]
+    nruns = int(meta.get("mcmc.nruns", 2))
+    burninfrac = float(meta.get("mcmc.burninfrac", 0.0))
+    thresholds = Thresholds.from_meta(meta)
+    while block is not None:
+        started = filesystem_time_ns(folder)
+        # Samples started from scratch ignore the outputs of earlier runs until mb rewrites them
+        monitors = [
+            SampleMonitor(
+                folder / nexus_file_name,
+                nruns,
+                burninfrac,
+                thresholds,
+                since=None if status == PARTIAL else started,
+            )
+            for nexus_file_name, status in pending
+        ]
+        with tracing.span("monitored mb", folder=str(folder), block=block):
+            process = Popen(
+                [mb, block], cwd=str(folder), stdin=stdin, stdout=stdout, stderr=stdout
+            )
+            converged = None
+            while converged is None:
+                try:
+                    process.wait(timeout=poll_interval)
+                except TimeoutExpired:
+                    pass
+                with tracing.span("monitor poll", folder=str(folder)):
+                    converged = next(
+                        (m for m in monitors if m.poll() is not None), None
+                    )
+                if process.returncode is not None:
+                    break
+            if converged is None:
+                return process.returncode
+
+            process.terminate()
+            process.wait()
+        nexus_file_name = Path(converged.prefix).name
+        for r in range(1, nruns + 1):
+            truncate_run(folder / f"{nexus_file_name}.run{r}", converged.stopped_at)
+        with MONITOR_LOCK:
+            stopped_at = read_stopped_at(folder)
+            stopped_at[nexus_file_name] = converged.stopped_at
+            write_stopped_at(folder, stopped_at)
+        print(
+            f"{folder}: {nexus_file_name} converged at generation "
+            f"{converged.stopped_at} (ASDSF {converged.asdsf:.4f}, min ESS {converged.ess:.0f})."
+        )
+        pending = pending_samples(folder, meta, samples)
+        block = write_resume_block(folder, meta, pending, resume_name)
+    return 0
+
+
+# Merges the tree files of each sample with galax into samp<i>merged.txt
+def postprocess(folder: Path, meta, force=False):
+    _, nexus_files = sample_files(meta)
+    tree_files = [f for f in mb_outputs(meta) if f.endswith(".t")]
+    merged_files = [f"samp{index}merged.txt" for index in range(1, len(nexus_files) + 1)]
+
+    def run_galax():
+        for index, nexus_file_name in enumerate(nexus_files, 1):
+            prefix = f"samp{index}"
+            listfile_path = folder / f"{prefix}_listfile.txt"
+            listfile_path.write_text(
+                "".join(f"{t}\n" for t in sample_tree_files(meta, index))
+            )
+            with tracing.span("galax", folder=str(folder), sample=index):
+                tracing.check_call(
+                    [
+                        "galax",
+                        "--listfile",
+                        listfile_path.name,
+                        "--outfile",
+                        f"{prefix}merged",
+                    ],
+                    cwd=str(folder),
+                )
+
+    StageCache(folder).run("galax", tree_files, {}, merged_files, run_galax, force)
+
+
+def run_stages(
+    folder: Path,
+    meta,
+    stages,
+    jobs=1,
+    force=False,
+    monitor=False,
+    catalog=None,
+    conv_cache=None,
+):
+    """
+    Run the given stages (``prepare``, ``mb``, ``postprocess``) on one
+    folder in that order, stopping at the first that fails. If a
+    ``Catalog`` is given, the folder is (re)registered in it and the
+    outcome of every stage is recorded.
+    """
+    parameters_json = folder / "parameters.json"
+    if catalog is not None:
+        catalog.add([run_record(parameters_json)])
+    for stage in stages:
+        try:
+            with tracing.span(stage, folder=str(folder)):
+                if stage == "prepare":
+                    prepare(folder, meta, jobs, force, conv_cache)
+                elif stage == "mb":
+                    returncode = run(folder, meta, force=force, monitor=monitor)
+                    if returncode:
+                        raise CalledProcessError(returncode, ["mb", "mbblock.nexus"])
+                else:
+                    postprocess(folder, meta, force)
+        except Exception:
+            if catalog is not None:
+                catalog.set_stage(parameters_json.resolve(), stage, FAILED)
+            raise
+        if catalog is not None:
+            catalog.set_stage(parameters_json.resolve(), stage, DONE)
+
+
+# Runs the stages on every cataloged folder where one of them has not succeeded yet
+def run_catalog(
+    catalog_path: Path, stages, jobs=1, force=False, monitor=False, conv_cache=None
+):
+    failed = 0
+    with Catalog(catalog_path) as catalog:
+        if force:
+            parameter_files = catalog.parameter_files()
+        else:
+            parameter_files = sorted(
+                {p for stage in stages for p in catalog.parameter_files(pending=stage)}
+            )
+        for parameters_json in parameter_files:
+            folder = parameters_json.parent
+            try:
+                meta = read_meta(folder)
+                run_stages(folder, meta, stages, jobs, force, monitor, catalog, conv_cache)
+            except Exception as e:
+                failed += 1
+                print(f"Failed {folder}: {e}", file=sys.stderr)
+        print(f"{len(parameter_files) - failed} of {len(parameter_files)} pending folders done.")
+    return failed
 
 
 def main():
     ap = argparse.ArgumentParser()
 
-    ap.add_argument("parameters", help="JSON file with parameters", type=Path)
+    ap.add_argument(
+        "parameters", help="JSON file with parameters", type=Path, nargs="?"
+    )
     ap.add_argument(
         "--prepare",
         help="prepare files and generate inputs for mb",
         action="store_true",
     )
+    ap.add_argument(
+        "--prepare-all",
+        help="prepare every folder with a parameters.json below this directory, in one process",
+        type=Path,
+        metavar="ROOT",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        help="number of worker processes for the FASTA to NEXUS conversion",
+        type=int,
+        default=1,
+    )
     ap.add_argument("--run", help="actually run mb", action="store_true")
+    ap.add_argument(
+        "--monitor",
+        help="stop each sample's mb run once its runs have converged (see the monitor.* parameters)",
+        action="store_true",
+    )
     ap.add_argument("--postprocess", help="postprocess output", action="store_true")
+    ap.add_argument(
+        "--force",
+        help="rerun the requested stages even if their inputs and parameters are unchanged",
+        action="store_true",
+    )
+
+    ap.add_argument(
+        "--catalog",
+        help="experiment catalog written by generatev2.py; stage outcomes are recorded in it, and without a parameters file the requested stages run on every cataloged folder where they have not succeeded yet",
+        type=Path,
+    )
+
+    ap.add_argument(
+        "--conv-cache",
+        help="directory of a cache of converted FASTA and NEXUS files shared by all folders; samples with the same contents and conversion parameters are copied from it instead of converted again",
+        type=Path,
+        metavar="DIR",
+    )
+    ap.add_argument(
+        "--conv-cache-mib",
+        help="evict the least recently used entries of the conversion cache beyond this size",
+        type=int,
+    )
+
+    ap.add_argument(
+        "--trace",
+        help="write a Chrome trace of every stage and child process to this JSON file and print a summary",
+        type=Path,
+    )
 
     A = ap.parse_args()
-    input_path = A.parameters.resolve()  # to absolute path
-    os.chdir(str(input_path.parent))  # change directory to MCMC simulation folder
+    if A.trace is not None:
+        tracing.enable(A.trace.resolve())
+    conv_cache = None
+    if A.conv_cache is not None:
+        max_bytes = None if A.conv_cache_mib is None else A.conv_cache_mib << 20
+        conv_cache = ConversionCache(A.conv_cache.resolve(), max_bytes)
+    try:
+        run_main(ap, A, conv_cache)
+    finally:
+        tracing.finish()
+        if conv_cache is not None:
+            print(conv_cache.report())
+            conv_cache.close()
 
-    meta = json.loads(input_path.read_text(encoding="utf-8"))
 
-    conv_files = [f"{strip_suffix(f, '.fasta')}_conv.fasta" for f in meta["inputs"]]
-    nexus_files = [f"{strip_suffix(f, '.fasta')}.nexus" for f in conv_files]
-
-    if A.prepare:
-        # construct arguments for mbblock
-        mbblock_args = []
-        for key, value in meta.items():
-            _, sep, name = key.partition("mcmc.")
-            if sep and name:
-                if isinstance(value, bool):
-                    value = "yes" if value else "no"
-                elif isinstance(value, (int, float)):
-                    value = str(value)
-
-                assert isinstance(
-                    value, str
-                ), f"key {key} with value {value} is not string"
-
-                mbblock_args.append(f"--{name}")
-                mbblock_args.append(value)
-
-        check_call(["charconverter.py", "--inFile"] + meta["inputs"])
-
-        insert_gap_at = meta["fasta_to_nexus.insert_gap_at"]
-        check_call(
-            ["fasta_to_nexus.py", "--inFile"]
-            + conv_files
-            + ([] if insert_gap_at is None else ["--insert-gap-at", str(insert_gap_at)])
+def run_main(ap, A, conv_cache=None):
+    stages = [
+        stage
+        for stage, requested in (
+            ("prepare", A.prepare),
+            ("mb", A.run),
+            ("postprocess", A.postprocess),
         )
+        if requested
+    ]
 
-        print("Calling mbblock with arguments", mbblock_args)
-        check_call(
-            ["mbblock_maker.py"]
-            + mbblock_args
-            + ["--outfile", "mbblock", "--inpath"]
-            + nexus_files
+    if A.prepare_all is not None:
+        if prepare_all(A.prepare_all.resolve(), A.jobs, A.force, conv_cache):
+            sys.exit(1)
+        if A.parameters is None:
+            return
+    if A.parameters is None and A.catalog is not None:
+        if run_catalog(A.catalog, stages, A.jobs, A.force, A.monitor, conv_cache):
+            sys.exit(1)
+        return
+    if A.parameters is None:
+        ap.error(
+            "the parameters argument is required unless --prepare-all or --catalog is given"
         )
 
-    if A.run:
-        check_call(["mb", "mbblock.nexus"])
+    input_path = A.parameters.resolve()  # to absolute path
+    catalog_path = None if A.catalog is None else A.catalog.resolve()
+    os.chdir(str(input_path.parent))  # change directory to MCMC simulation folder
 
-    if A.postprocess:
-        for index, nexus_file_name in enumerate(nexus_files, 1):
-            prefix = f"samp{index}"
-            listfile_path = Path(f"{prefix}_listfile.txt")
-            listfile_path.write_text(
-                "".join(
-                    f"{nexus_file_name}.run{run_index}.t\n"
-                    for run_index in range(1, 2 + 1)
-                )
-            )
-            check_call(
-                [
-                    "galax",
-                    "--listfile",
-                    str(listfile_path),
-                    "--outfile",
-                    f"{prefix}merged",
-                ]
+    meta = json.loads(input_path.read_text(encoding="utf-8"))
+
+    if catalog_path is None:
+        run_stages(
+            input_path.parent, meta, stages, A.jobs, A.force, A.monitor, conv_cache=conv_cache
+        )
+    else:
+        with Catalog(catalog_path) as catalog:
+            run_stages(
+                input_path.parent, meta, stages, A.jobs, A.force, A.monitor, catalog, conv_cache
             )
 
 
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+# Names of the files run.py derives from a folder's parameters.json, shared
+# with the scripts that read its outputs
+
+
+def strip_suffix(string: str, suffix: str) -> str:
+    assert string.endswith(suffix)
+    return string[: -len(suffix)]
+
+
+def sample_files(meta):
+    conv_files = [f"{strip_suffix(f, '.fasta')}_conv.fasta" for f in meta["inputs"]]
+    nexus_files = [f"{strip_suffix(f, '.fasta')}.nexus" for f in conv_files]
+    return conv_files, nexus_files
+
+
+# The .t files galax merges for sample <index> (counting from 1)
+def sample_tree_files(meta, index):
+    _, nexus_files = sample_files(meta)
+    return [f"{nexus_files[index - 1]}.run{run_index}.t" for run_index in range(1, 2 + 1)]
+
+
+# The .t and .p files written by mb for every sample
+def mb_outputs(meta):
+    _, nexus_files = sample_files(meta)
+    nruns = int(meta.get("mcmc.nruns", 2))
+    return [
+        f"{nexus_file_name}.run{run_index}.{ext}"
+        for nexus_file_name in nexus_files
+        for run_index in range(1, nruns + 1)
+        for ext in ("t", "p")
+    ]
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import os
+from pathlib import Path
+from subprocess import DEVNULL
+import time
+import traceback
+from typing import Optional
+
+import attr
+
+import run
+
+
+@attr.s
+class Job:
+    folder: Path = attr.ib()
+    cores: int = attr.ib()
+
+
+@attr.s
+class JobResult:
+    folder: str = attr.ib()
+    cores: int = attr.ib()
+    returncode: Optional[int] = attr.ib()
+    wall_time: float = attr.ib()
+    log: str = attr.ib()
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Every folder with a parameters.json is a job that occupies nchains x nruns cores for each of its mb shards
+def find_jobs(root: Path, total_cores: int):
+    jobs = []
+    for parameters_json in sorted(root.rglob("parameters.json")):
+        meta = json.loads(parameters_json.read_text(encoding="utf-8"))
+        cores = max(1, len(run.shard_blocks(meta))) * run.mb_cores(meta)
+        # A job larger than the machine runs on its own, with its shards taking turns
+        jobs.append(Job(folder=parameters_json.parent, cores=min(cores, total_cores)))
+    return jobs
+
+
+def run_job(job: Job, mb: str, log_name: str, monitor=False) -> JobResult:
+    log_path = job.folder / log_name
+    start = time.perf_counter()
+    try:
+        with open(log_path, "w") as log:
+            # Nobody can answer a prompt from mb here
+            returncode = run.run(
+                job.folder,
+                mb=mb,
+                stdin=DEVNULL,
+                stdout=log,
+                monitor=monitor,
+                cores=job.cores,
+            )
+    except Exception:
+        # e.g. the mb executable could not be started or the folder is broken;
+        # the job fails and the others keep running
+        log_path.write_text(traceback.format_exc())
+        returncode = None
+    return JobResult(
+        folder=str(job.folder),
+        cores=job.cores,
+        returncode=returncode,
+        wall_time=time.perf_counter() - start,
+        log=str(log_path),
+    )
+
+
+def schedule(jobs, total_cores, mb="mb", log_name="mb.log", monitor=False):
+    """
+    Run all jobs with at most ``total_cores`` cores busy at any time.
+    Whenever cores free up, the largest pending jobs that fit are
+    started first. Returns one ``JobResult`` per job in completion order.
+    Raises ``ValueError`` if a job needs more than ``total_cores``, as it
+    could never start.
+    """
+    if total_cores < 1:
+        raise ValueError(f"Need at least one core, got {total_cores}")
+    pending = sorted(jobs, key=lambda j: j.cores, reverse=True)
+    free = total_cores
+    running = {}
+    results = []
+    with ThreadPoolExecutor(max_workers=total_cores) as pool:
+        while pending or running:
+            for job in list(pending):
+                if job.cores <= free:
+                    pending.remove(job)
+                    free -= job.cores
+                    running[pool.submit(run_job, job, mb, log_name, monitor)] = job
+                    print(f"Started {job.folder} on {job.cores} cores.")
+            if not running:
+                raise ValueError(
+                    "; ".join(
+                        f"{job.folder} needs {job.cores} cores, more than the {total_cores} available"
+                        for job in pending
+                    )
+                )
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                free += job.cores
+                result = future.result()
+                results.append(result)
+                print(
+                    f"Finished {job.folder} with exit status {result.returncode} "
+                    f"after {result.wall_time:.1f} s."
+                )
+    return results
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "root",
+        help="Directory tree containing prepared MCMC folders with parameters.json files.",
+        type=Path,
+    )
+    ap.add_argument(
+        "--cores",
+        type=positive_int,
+        default=available_cores(),
+        help="Number of cores to keep busy. Defaults to the cores available to this process.",
+    )
+    ap.add_argument(
+        "--mb", default="mb", help="MrBayes executable to run in each folder."
+    )
+    ap.add_argument(
+        "--monitor",
+        help="Stop each sample's mb run once its runs have converged (see run.py --monitor).",
+        action="store_true",
+    )
+    ap.add_argument(
+        "--report",
+        type=Path,
+        help="JSON file receiving the per-job results. Defaults to ROOT/schedule_report.json.",
+    )
+    A = ap.parse_args()
+
+    root = A.root.resolve()
+    jobs = find_jobs(root, A.cores)
+    print(f"Scheduling {len(jobs)} jobs on {A.cores} cores.")
+
+    start = time.perf_counter()
+    results = schedule(jobs, A.cores, mb=A.mb, monitor=A.monitor)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r.returncode != 0]
+    jobs_per_hour = len(results) / elapsed * 3600 if elapsed > 0 else 0.0
+    report = {
+        "cores": A.cores,
+        "wall_time": elapsed,
+        "jobs_per_hour": jobs_per_hour,
+        "failed": len(failed),
+        "jobs": [attr.asdict(r) for r in results],
+    }
+    report_path = A.report or root / "schedule_report.json"
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    print(
+        f"{len(results) - len(failed)} of {len(results)} jobs succeeded in {elapsed:.1f} s "
+        f"({jobs_per_hour:.1f} jobs/hour). Report written to {report_path}."
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import tracing
+
+MANIFEST_NAME = ".stages.json"
+
+
+def params_with_prefix(meta, prefix) -> dict:
+    return {k: v for k, v in meta.items() if k.startswith(prefix)}
+
+
+class StageCache:
+    """
+    Make-like record of the pipeline stages run in one MCMC folder.
+
+    Each stage is stored in ``<folder>/.stages.json`` with a fingerprint
+    of its input files' contents and of the parameters it depends on. A
+    stage only has to run again if that fingerprint changes or one of its
+    outputs is missing. File digests are remembered by size and mtime, so
+    unchanged files are not hashed twice.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+        try:
+            manifest = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifest = {}
+        self.stages = manifest.get("stages", {})
+        self.file_hashes = manifest.get("file_hashes", {})
+
+    def file_digest(self, name) -> str:
+        stat = os.stat(self.folder / name)
+        known = self.file_hashes.get(name)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(self.folder / name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.file_hashes[name] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def fingerprint(self, inputs, params) -> str:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+        for name in inputs:
+            digest.update(f"\0{name}\0{self.file_digest(name)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_fresh(self, stage, fingerprint, outputs) -> bool:
+        entry = self.stages.get(stage)
+        return (
+            entry is not None
+            and entry["fingerprint"] == fingerprint
+            and all((self.folder / name).exists() for name in outputs)
+        )
+
+    def record(self, stage, fingerprint, outputs):
+        self.stages[stage] = {"fingerprint": fingerprint, "outputs": list(outputs)}
+        self.save()
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps({"stages": self.stages, "file_hashes": self.file_hashes}, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+    def run(self, stage, inputs, params, outputs, action, force=False) -> bool:
+        """
+        Call ``action()`` unless ``stage`` is up to date, then record its
+        new fingerprint. Returns whether the action was called. If the
+        action raises, the stage stays stale.
+        """
+        fingerprint = self.fingerprint(inputs, params)
+        if not force and self.is_fresh(stage, fingerprint, outputs):
+            print(f"Stage {stage} in {self.folder} is up to date.")
+            return False
+        self.invalidate(stage)
+        with tracing.span(f"stage {stage}", folder=str(self.folder)):
+            action()
+        self.record(stage, fingerprint, outputs)
+        return True
@@ -1,8 +1,11 @@
 #! /usr/bin/env python3
 
 import sys, argparse
-from Bio import SeqIO
-from random import sample
+from random import Random, sample
+
+from fastaio import load_index, read_records, read_sequence, record_name
+from packedfasta import SUFFIX as PACKED_SUFFIX
+from packedfasta import PackedFasta, is_packed, write_packed
 
 # Command line arguments
 def readArguments():
@@ -24,25 +27,130 @@ def readArguments():
         default=1,
         help="Number of times to run the subsampler.",
     )
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Read the input file only once and draw the samples of all iterations from it. Each output file is written through one buffered handle and is overwritten instead of appended to.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the random number generator used by --single-pass and --index. For reproducible samples, use this option.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Like --single-pass, but read only the sampled records by seeking through an on-disk index (<inFile>.fxi) instead of loading the whole file. The index is built on first use and rebuilt when the input changes.",
+    )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Write the samples as 2-bit packed files (<outFile>_<n>.pfa) instead of FASTA. Requires --single-pass or --index. Packed input files are always detected and read directly.",
+    )
     args = parser.parse_args()
+    if args.packed and not (args.single_pass or args.index):
+        parser.error("--packed requires --single-pass or --index")
     return args
 
 
+# Draws the record indices of every iteration up front, so the input only has to be read once
+def draw_samples(count, number, iterations, rng):
+    population = range(count)
+    return [rng.sample(population, number) for _ in range(iterations)]
+
+
+# Like draw_samples, with every iteration drawn from its own seed
+def draw_seeded_samples(count, number, seeds):
+    population = range(count)
+    return [Random(seed).sample(population, number) for seed in seeds]
+
+
+# Reads all records as (name, sequence) pairs from a FASTA or packed file
+def load_records(inFile):
+    if is_packed(inFile):
+        with PackedFasta(inFile) as packed:
+            return [(record_name(h), seq.decode("ascii")) for h, seq in packed]
+    return read_records(inFile)
+
+
+# Writes each sample to <outFile>_<n>.fasta through a single buffered handle
+def write_samples(records, samples, outFile, packed=False):
+    for n, indices in enumerate(samples, 1):
+        if packed:
+            write_packed(
+                outFile + "_" + str(n) + PACKED_SUFFIX, (records[i] for i in indices)
+            )
+            continue
+        with open(outFile + "_" + str(n) + ".fasta", "w", buffering=1 << 20) as outfile:
+            outfile.writelines(">{}\n{}\n".format(*records[i]) for i in indices)
+
+
+def main_single_pass(args):
+    print("Subsampling...")
+    records = load_records(args.inFile)
+    if len(records) == 0:
+        print("Empty array. Check array. Exiting...")
+        return -1
+    samples = draw_samples(len(records), args.number, args.iterations, Random(args.seed))
+    write_samples(records, samples, args.outFile, args.packed)
+    print("Done.")
+    return 0
+
+
+def main_indexed(args):
+    if is_packed(args.inFile):
+        return main_packed(args)
+    print("Subsampling...")
+    entries = load_index(args.inFile)
+    if len(entries) == 0:
+        print("Empty array. Check array. Exiting...")
+        return -1
+    samples = draw_samples(len(entries), args.number, args.iterations, Random(args.seed))
+    # Only the sampled records are ever read into memory
+    with open(args.inFile, "rb") as fasta:
+        records = {
+            i: (entries[i].name, read_sequence(fasta, entries[i]))
+            for i in sorted({i for indices in samples for i in indices})
+        }
+    write_samples(records, samples, args.outFile, args.packed)
+    print("Done.")
+    return 0
+
+
+# Packed files carry their own offset table, so they need no separate index
+def main_packed(args):
+    print("Subsampling...")
+    with PackedFasta(args.inFile) as packed:
+        if len(packed) == 0:
+            print("Empty array. Check array. Exiting...")
+            return -1
+        samples = draw_samples(len(packed), args.number, args.iterations, Random(args.seed))
+        records = {
+            i: (record_name(packed.header(i)), packed.sequence(i).decode("ascii"))
+            for i in sorted({i for indices in samples for i in indices})
+        }
+    write_samples(records, samples, args.outFile, args.packed)
+    print("Done.")
+    return 0
+
+
 def main(args):
+    if args.index:
+        return main_indexed(args)
+    if args.single_pass:
+        return main_single_pass(args)
     print("Subsampling...")
     for n in range(1, args.iterations + 1):
         # Read FASTA file
-        with open(args.inFile, "r") as raw:
-            dataset = SeqIO.parse(raw, "fasta")
-            data_array = list(dataset)
-            if len(data_array) == 0:
-                print("Empty array. Check array. Exiting...")
-                return -1
-            subset = ((seq.name, seq.seq) for seq in sample(data_array, args.number))
-            for i in subset:
-                with open(args.outFile + "_" + str(n) + ".fasta", "a+") as outfile:
-                    outfile.write(">{}\n{}\n".format(*i))  # Write FASTA file
-                outfile.close()
+        data_array = load_records(args.inFile)
+        if len(data_array) == 0:
+            print("Empty array. Check array. Exiting...")
+            return -1
+        subset = sample(data_array, args.number)
+        for i in subset:
+            with open(args.outFile + "_" + str(n) + ".fasta", "a+") as outfile:
+                outfile.write(">{}\n{}\n".format(*i))  # Write FASTA file
+            outfile.close()
     print("Done.")
     return 0
 
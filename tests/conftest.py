@@ -0,0 +1,113 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+# The scripts are top-level modules of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Stands in for MrBayes: for every "execute" of the block it writes .t and .p
+# files of two runs up to the block's ngen. If the folder has a file named
+# "interrupt", it is removed and mb stops after the first sample, leaving the
+# second one half done with a checkpoint. $FAKE_MB_SLEEP seconds pass before the
+# first sample and $FAKE_MB_SAMPLE_SLEEP after every sample. Every call is
+# appended to mb_calls.txt in the folder and, with start and end times, to
+# $FAKE_MB_LOG.
+FAKE_MB = r'''
+import os, re, sys, time
+
+block_name = sys.argv[1]
+blocks = re.findall(r"execute (\S+);.*?mcmc ngen=(\d+) samplefreq=(\d+)", open(block_name).read(), re.S)
+with open("mb_calls.txt", "a") as calls:
+    calls.write(block_name + "\n")
+started = time.time()
+time.sleep(float(os.environ.get("FAKE_MB_SLEEP", "0")))
+interrupted = os.path.exists("interrupt")
+if interrupted:
+    os.remove("interrupt")
+
+
+def write_sample(name, ngen, samplefreq):
+    for r in (1, 2):
+        with open(f"{name}.run{r}.t", "w") as t, open(f"{name}.run{r}.p", "w") as p:
+            t.write("#NEXUS\nbegin trees;\n")
+            p.write("[ID: 1]\nGen\tLnL\n")
+            for gen in range(0, ngen + 1, samplefreq):
+                t.write(f"   tree gen.{gen} = [&U] (1,2,(3,4));\n")
+                p.write(f"{gen}\t-100.0\n")
+            if ngen % samplefreq == 0:
+                t.write("end;\n")
+
+
+for i, (name, ngen, samplefreq) in enumerate(blocks):
+    if interrupted and i == 1:
+        write_sample(name, int(ngen) // 2, int(samplefreq))
+        open(f"{name}.ckp", "w").close()
+        sys.exit(1)
+    write_sample(name, int(ngen), int(samplefreq))
+    time.sleep(float(os.environ.get("FAKE_MB_SAMPLE_SLEEP", "0")))
+if os.environ.get("FAKE_MB_LOG"):
+    with open(os.environ["FAKE_MB_LOG"], "a") as log:
+        log.write(f"{os.getcwd()} {started} {time.time()}\n")
+'''
+
+
+@pytest.fixture
+def fake_mb(tmp_path):
+    path = tmp_path / "fake_mb"
+    path.write_text(f"#!{sys.executable}\n{FAKE_MB}")
+    path.chmod(0o755)
+    return str(path)
+
+
+NEXUS = "#NEXUS\nbegin data;\ndimensions ntax=4 nchar=4;\nformat datatype=dna missing=? gap=-;\nmatrix\na ACGT\nb ACGT\nc ACGA\nd ACTA\n\t;\nend;\n"
+
+
+@pytest.fixture
+def make_folder():
+    """Write a prepared MCMC folder: parameters.json, the samples' NEXUS files, mbblock.nexus and its shards."""
+    import json
+
+    import mbblock_maker
+    from run import mb_shards, mbblock_params, shard_block
+    from samplefiles import sample_files
+
+    def make(folder: Path, nsamples=2, **params):
+        folder.mkdir(parents=True)
+        meta = {
+            "inputs": [f"samp_{i}.fasta" for i in range(1, nsamples + 1)],
+            "mcmc.nst": 6,
+            "mcmc.rates": "invgamma",
+            "mcmc.ngammacat": 4,
+            "mcmc.brlenspr": "unconstrained:exp(10.0)",
+            "mcmc.shapepr": "exp(1.0)",
+            "mcmc.statefreqpr": "dirichlet(1.0,1.0,1.0,1.0)",
+            "mcmc.revmatpr": "dirichlet(1.0,1.0,1.0,1.0,1.0,1.0)",
+            "mcmc.ngen": 1000,
+            "mcmc.samplefreq": 100,
+            "mcmc.printfreq": 100,
+            "mcmc.burninfrac": 0.1,
+            "mcmc.nchains": 1,
+            "mcmc.nruns": 2,
+            "fasta_to_nexus.insert_gap_at": None,
+        }
+        meta.update(params)
+        (folder / "parameters.json").write_text(json.dumps(meta))
+        _, nexus_files = sample_files(meta)
+        for name in nexus_files:
+            (folder / name).write_text(NEXUS)
+        with open(folder / "mbblock.nexus", "w") as mbblocks:
+            mbblock_maker.write_blocks(nexus_files, mbblock_params(meta), mbblocks)
+        shards = mb_shards(folder, meta)
+        if shards is not None:
+            index = {name: i for i, name in enumerate(nexus_files)}
+            mbblock_maker.write_shards(
+                nexus_files,
+                mbblock_params(meta),
+                [[index[name] for name in shard] for shard in shards],
+                lambda k: folder / shard_block(k),
+            )
+        return meta
+
+    return make
+
@@ -0,0 +1,82 @@
+[ID: 9409050143]
+Gen	LnL	TL
+0	-110.804	0.508
+100	-106.371	0.517
+200	-103.365	0.464
+300	-100.836	0.503
+400	-101.648	0.393
+500	-101.475	0.582
+600	-100.784	0.606
+700	-100.509	0.490
+800	-101.524	0.455
+900	-100.569	0.454
+1000	-100.067	0.455
+1100	-100.645	0.497
+1200	-100.403	0.514
+1300	-99.325	0.423
+1400	-100.473	0.542
+1500	-100.608	0.552
+1600	-99.715	0.549
+1700	-101.739	0.534
+1800	-99.879	0.472
+1900	-101.261	0.520
+2000	-102.115	0.392
+2100	-100.944	0.551
+2200	-100.182	0.503
+2300	-100.801	0.526
+2400	-101.299	0.420
+2500	-100.465	0.483
+2600	-100.561	0.440
+2700	-100.524	0.510
+2800	-100.286	0.484
+2900	-101.818	0.567
+3000	-100.823	0.566
+3100	-100.394	0.525
+3200	-100.310	0.551
+3300	-99.321	0.463
+3400	-98.200	0.528
+3500	-99.188	0.631
+3600	-99.407	0.477
+3700	-99.936	0.554
+3800	-100.387	0.515
+3900	-101.164	0.534
+4000	-101.341	0.545
+4100	-101.898	0.540
+4200	-102.249	0.505
+4300	-100.165	0.432
+4400	-100.142	0.463
+4500	-99.797	0.552
+4600	-101.501	0.472
+4700	-99.603	0.546
+4800	-98.777	0.528
+4900	-100.616	0.495
+5000	-100.845	0.531
+5100	-100.173	0.532
+5200	-99.186	0.500
+5300	-99.364	0.538
+5400	-99.942	0.511
+5500	-102.374	0.473
+5600	-100.847	0.432
+5700	-99.679	0.429
+5800	-99.866	0.512
+5900	-99.048	0.375
+6000	-100.062	0.503
+6100	-100.152	0.470
+6200	-99.265	0.526
+6300	-100.451	0.441
+6400	-97.987	0.527
+6500	-99.575	0.426
+6600	-100.512	0.554
+6700	-99.236	0.478
+6800	-100.132	0.487
+6900	-99.695	0.528
+7000	-100.770	0.560
+7100	-100.463	0.569
+7200	-100.885	0.543
+7300	-101.483	0.578
+7400	-102.292	0.570
+7500	-100.735	0.584
+7600	-101.024	0.551
+7700	-99.954	0.504
+7800	-100.421	0.546
+7900	-99.247	0.447
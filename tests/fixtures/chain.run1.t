@@ -0,0 +1,89 @@
+#NEXUS
+[ID: 9409050143]
+begin trees;
+   translate
+      1 a,
+      2 b,
+      3 c,
+      4 d;
+   tree gen.0 = [&U] (1,3,(2,4));
+   tree gen.100 = [&U] (1,2,(3,4));
+   tree gen.200 = [&U] (1,4,(2,3));
+   tree gen.300 = [&U] (1,2,(3,4));
+   tree gen.400 = [&U] (1,3,(2,4));
+   tree gen.500 = [&U] (1,4,(2,3));
+   tree gen.600 = [&U] (1,4,(2,3));
+   tree gen.700 = [&U] (1,4,(2,3));
+   tree gen.800 = [&U] (1,3,(2,4));
+   tree gen.900 = [&U] (1,2,(3,4));
+   tree gen.1000 = [&U] (1,3,(2,4));
+   tree gen.1100 = [&U] (1,3,(2,4));
+   tree gen.1200 = [&U] (1,4,(2,3));
+   tree gen.1300 = [&U] (1,2,(3,4));
+   tree gen.1400 = [&U] (1,4,(2,3));
+   tree gen.1500 = [&U] (1,3,(2,4));
+   tree gen.1600 = [&U] (1,2,(3,4));
+   tree gen.1700 = [&U] (1,2,(3,4));
+   tree gen.1800 = [&U] (1,2,(3,4));
+   tree gen.1900 = [&U] (1,2,(3,4));
+   tree gen.2000 = [&U] (1,3,(2,4));
+   tree gen.2100 = [&U] (1,4,(2,3));
+   tree gen.2200 = [&U] (1,3,(2,4));
+   tree gen.2300 = [&U] (1,4,(2,3));
+   tree gen.2400 = [&U] (1,4,(2,3));
+   tree gen.2500 = [&U] (1,2,(3,4));
+   tree gen.2600 = [&U] (1,2,(3,4));
+   tree gen.2700 = [&U] (1,2,(3,4));
+   tree gen.2800 = [&U] (1,2,(3,4));
+   tree gen.2900 = [&U] (1,2,(3,4));
+   tree gen.3000 = [&U] (1,2,(3,4));
+   tree gen.3100 = [&U] (1,2,(3,4));
+   tree gen.3200 = [&U] (1,2,(3,4));
+   tree gen.3300 = [&U] (1,2,(3,4));
+   tree gen.3400 = [&U] (1,2,(3,4));
+   tree gen.3500 = [&U] (1,2,(3,4));
+   tree gen.3600 = [&U] (1,2,(3,4));
+   tree gen.3700 = [&U] (1,2,(3,4));
+   tree gen.3800 = [&U] (1,2,(3,4));
+   tree gen.3900 = [&U] (1,2,(3,4));
+   tree gen.4000 = [&U] (1,2,(3,4));
+   tree gen.4100 = [&U] (1,2,(3,4));
+   tree gen.4200 = [&U] (1,2,(3,4));
+   tree gen.4300 = [&U] (1,3,(2,4));
+   tree gen.4400 = [&U] (1,2,(3,4));
+   tree gen.4500 = [&U] (1,2,(3,4));
+   tree gen.4600 = [&U] (1,2,(3,4));
+   tree gen.4700 = [&U] (1,3,(2,4));
+   tree gen.4800 = [&U] (1,2,(3,4));
+   tree gen.4900 = [&U] (1,2,(3,4));
+   tree gen.5000 = [&U] (1,2,(3,4));
+   tree gen.5100 = [&U] (1,2,(3,4));
+   tree gen.5200 = [&U] (1,2,(3,4));
+   tree gen.5300 = [&U] (1,2,(3,4));
+   tree gen.5400 = [&U] (1,2,(3,4));
+   tree gen.5500 = [&U] (1,2,(3,4));
+   tree gen.5600 = [&U] (1,2,(3,4));
+   tree gen.5700 = [&U] (1,2,(3,4));
+   tree gen.5800 = [&U] (1,3,(2,4));
+   tree gen.5900 = [&U] (1,2,(3,4));
+   tree gen.6000 = [&U] (1,2,(3,4));
+   tree gen.6100 = [&U] (1,2,(3,4));
+   tree gen.6200 = [&U] (1,2,(3,4));
+   tree gen.6300 = [&U] (1,2,(3,4));
+   tree gen.6400 = [&U] (1,2,(3,4));
+   tree gen.6500 = [&U] (1,2,(3,4));
+   tree gen.6600 = [&U] (1,2,(3,4));
+   tree gen.6700 = [&U] (1,2,(3,4));
+   tree gen.6800 = [&U] (1,2,(3,4));
+   tree gen.6900 = [&U] (1,2,(3,4));
+   tree gen.7000 = [&U] (1,2,(3,4));
+   tree gen.7100 = [&U] (1,2,(3,4));
+   tree gen.7200 = [&U] (1,2,(3,4));
+   tree gen.7300 = [&U] (1,2,(3,4));
+   tree gen.7400 = [&U] (1,2,(3,4));
+   tree gen.7500 = [&U] (1,2,(3,4));
+   tree gen.7600 = [&U] (1,2,(3,4));
+   tree gen.7700 = [&U] (1,2,(3,4));
+   tree gen.7800 = [&U] (1,2,(3,4));
+   tree gen.7900 = [&U] (1,2,(3,4));
+end;
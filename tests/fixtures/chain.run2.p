@@ -0,0 +1,82 @@
+[ID: 9409050143]
+Gen	LnL	TL
+0	-112.189	0.538
+100	-106.089	0.500
+200	-102.553	0.478
+300	-101.685	0.571
+400	-102.478	0.550
+500	-99.861	0.562
+600	-99.413	0.500
+700	-100.708	0.456
+800	-101.628	0.522
+900	-102.485	0.465
+1000	-99.913	0.538
+1100	-100.580	0.472
+1200	-101.177	0.437
+1300	-101.457	0.599
+1400	-100.786	0.543
+1500	-99.105	0.497
+1600	-99.063	0.503
+1700	-99.820	0.599
+1800	-99.552	0.470
+1900	-99.866	0.501
+2000	-98.683	0.436
+2100	-96.776	0.465
+2200	-99.827	0.546
+2300	-99.137	0.493
+2400	-99.819	0.528
+2500	-100.333	0.581
+2600	-99.691	0.577
+2700	-99.819	0.501
+2800	-98.573	0.548
+2900	-98.367	0.536
+3000	-98.815	0.500
+3100	-99.846	0.512
+3200	-102.207	0.512
+3300	-101.343	0.533
+3400	-102.555	0.581
+3500	-100.419	0.558
+3600	-98.705	0.462
+3700	-98.693	0.521
+3800	-97.587	0.445
+3900	-98.441	0.414
+4000	-99.786	0.548
+4100	-99.686	0.501
+4200	-100.699	0.528
+4300	-101.872	0.486
+4400	-100.641	0.502
+4500	-102.194	0.612
+4600	-99.803	0.570
+4700	-101.145	0.534
+4800	-100.532	0.552
+4900	-98.392	0.459
+5000	-98.802	0.567
+5100	-98.999	0.528
+5200	-100.550	0.458
+5300	-102.082	0.445
+5400	-100.820	0.616
+5500	-102.575	0.528
+5600	-101.633	0.542
+5700	-99.638	0.515
+5800	-99.903	0.594
+5900	-99.667	0.508
+6000	-99.809	0.540
+6100	-100.205	0.368
+6200	-100.204	0.507
+6300	-100.559	0.461
+6400	-101.246	0.632
+6500	-99.569	0.456
+6600	-100.057	0.483
+6700	-98.820	0.481
+6800	-101.386	0.461
+6900	-100.316	0.530
+7000	-101.166	0.465
+7100	-101.316	0.519
+7200	-98.939	0.475
+7300	-100.813	0.568
+7400	-100.149	0.624
+7500	-99.633	0.508
+7600	-100.096	0.474
+7700	-98.999	0.511
+7800	-100.081	0.488
+7900	-100.747	0.464
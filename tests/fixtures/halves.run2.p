@@ -0,0 +1,12 @@
+[ID: 9409050143]
+Gen	LnL	TL
+0	-100.000	0.500
+100	-101.000	0.500
+200	-102.000	0.500
+300	-103.000	0.500
+400	-104.000	0.500
+500	-105.000	0.500
+600	-106.000	0.500
+700	-107.000	0.500
+800	-108.000	0.500
+900	-109.000	0.500
@@ -0,0 +1,19 @@
+#NEXUS
+[ID: 9409050143]
+begin trees;
+   translate
+      1 a,
+      2 b,
+      3 c,
+      4 d;
+   tree gen.0 = [&U] (1,2,(3,4));
+   tree gen.100 = [&U] (1,3,(2,4));
+   tree gen.200 = [&U] (1,2,(3,4));
+   tree gen.300 = [&U] (1,3,(2,4));
+   tree gen.400 = [&U] (1,2,(3,4));
+   tree gen.500 = [&U] (1,3,(2,4));
+   tree gen.600 = [&U] (1,2,(3,4));
+   tree gen.700 = [&U] (1,3,(2,4));
+   tree gen.800 = [&U] (1,2,(3,4));
+   tree gen.900 = [&U] (1,3,(2,4));
+end;
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import attr
+import pytest
+
+from bipartitions import COLUMNS, information_table
+from parser import parse_galax_information_table_output
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def test_information_table_matches_the_galax_reference():
+    reference = parse_galax_information_table_output(
+        (FIXTURES / "halves.galax.txt").read_text(encoding="utf-8")
+    )
+    assert reference.columns == COLUMNS
+    rows = information_table([FIXTURES / "halves.run1.t", FIXTURES / "halves.run2.t"])
+    assert [Path(row.treefile).name for row in rows] == reference.column("treefile")
+    for row, expected in zip(rows, reference.rows):
+        values = attr.astuple(row)
+        assert values[1] == expected[1]
+        # galax prints five decimals
+        assert values[2:] == pytest.approx(expected[2:], abs=1e-5)
@@ -0,0 +1,25 @@
+from convcache import ConversionCache
+
+
+def test_rewriting_outputs_in_place_leaves_the_cache_alone(tmp_path):
+    folders = [tmp_path / "a", tmp_path / "b"]
+    for folder in folders:
+        folder.mkdir()
+    output = folders[0] / "samp_1.nexus"
+    output.write_bytes(b"converted")
+    with ConversionCache(tmp_path / "cache") as cache:
+        key = cache.key("nexus", {}, "0" * 64)
+        cache.store(key, output)
+        assert cache.fetch(key, folders[1] / "samp_1.nexus")
+        assert not cache.fetch(cache.key("nexus", {}, "1" * 64), folders[1] / "other.nexus")
+
+        # What the converters' command line scripts do to an existing output
+        for folder in folders:
+            with open(folder / "samp_1.nexus", "wb") as f:
+                f.write(b"rewritten " + folder.name.encode())
+        assert cache.object_path(key).read_bytes() == b"converted"
+        assert cache.fetch(key, folders[0] / "samp_1.nexus")
+        assert output.read_bytes() == b"converted"
+        assert (folders[1] / "samp_1.nexus").read_bytes() == b"rewritten b"
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert not list((tmp_path / "b").glob("*.tmp"))
@@ -0,0 +1,32 @@
+import os
+
+from fastaio import append_file
+
+
+def test_append_file(tmp_path):
+    (tmp_path / "part").write_bytes(b">b\nACGT\n")
+    with open(tmp_path / "out", "wb") as out:
+        out.write(b">a\nTTTT\n")
+        append_file(tmp_path / "part", out)
+        out.write(b">c\nGG\n")
+    assert (tmp_path / "out").read_bytes() == b">a\nTTTT\n>b\nACGT\n>c\nGG\n"
+
+
+def test_append_file_fallback_does_not_duplicate(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 64
+    (tmp_path / "part").write_bytes(data)
+    real_copy = os.copy_file_range
+
+    # Copies a little, then fails as a file system without support would
+    def failing_copy(src, dst, count, *args):
+        if failing_copy.calls:
+            raise OSError("not supported")
+        failing_copy.calls += 1
+        return real_copy(src, dst, min(count, 1000), *args)
+
+    failing_copy.calls = 0
+    monkeypatch.setattr(os, "copy_file_range", failing_copy)
+    with open(tmp_path / "out", "wb") as out:
+        out.write(b"head")
+        append_file(tmp_path / "part", out)
+    assert (tmp_path / "out").read_bytes() == b"head" + data
@@ -0,0 +1,170 @@
+from collections import Counter
+from math import sqrt
+from pathlib import Path
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+import monitor
+from monitor import RunTrace, SampleMonitor, Thresholds, effective_sample_size, truncate_run
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def naive_ess(x):
+    """Geyer's initial positive sequence with the autocorrelations summed directly."""
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    x = x - x.mean()
+    variance = x.dot(x) / n
+    rho = [x[: n - k].dot(x[k:]) / (n * variance) for k in range(n)]
+    tau = -1.0
+    for m in range(n // 2):
+        pair = rho[2 * m] + rho[2 * m + 1]
+        if pair <= 0:
+            break
+        tau += 2 * pair
+    return n / max(tau, 1.0 / n)
+
+
+def naive_stop(prefix, nruns, burninfrac, thresholds):
+    """Generation a monitor has to stop at, recomputing everything from scratch for every sample."""
+    runs = [RunTrace(f"{prefix}.run{r}") for r in range(1, nruns + 1)]
+    for run in runs:
+        run.poll()
+    streak = 0
+    for checked in range(1, min(len(run) for run in runs) + 1):
+        burnin = int(checked * burninfrac)
+        kept = checked - burnin
+        counts = [Counter(s for splits in run.splits[burnin:checked] for s in splits) for run in runs]
+        deviations = []
+        for split in set().union(*counts):
+            frequencies = [c[split] / kept for c in counts]
+            if max(frequencies) >= thresholds.min_partfreq:
+                mean = sum(frequencies) / nruns
+                deviations.append(sqrt(sum((f - mean) ** 2 for f in frequencies) / (nruns - 1)))
+        asdsf = sum(deviations) / len(deviations) if deviations else 0.0
+        ok = asdsf <= thresholds.max_asdsf and min(
+            naive_ess(np.asarray(run.values[burnin:checked])[:, j])
+            for run in runs
+            for j in range(len(run.columns) - 1)
+        ) >= thresholds.min_ess
+        streak = streak + 1 if ok else 0
+        if streak >= thresholds.consecutive:
+            return runs[0].generations[checked - 1]
+    return None
+
+
+def test_asdsf_of_fixture():
+    # Split {c,d} is in every tree of run 1 and half of run 2, split {b,d} in half of run 2
+    m = SampleMonitor(FIXTURES / "halves", nruns=2)
+    m.poll()
+    assert m.checked == 10
+    assert m.asdsf == pytest.approx(sqrt(0.125))
+    assert m.stopped_at is None
+
+
+def test_run_trace_reads_growing_files(tmp_path):
+    for ext in ("t", "p"):
+        data = (FIXTURES / f"chain.run1.{ext}").read_bytes()
+        (tmp_path / f"chain.run1.{ext}").write_bytes(data[: len(data) // 2])
+    trace = RunTrace(tmp_path / "chain.run1")
+    trace.poll()
+    assert 0 < len(trace) < 80
+    for ext in ("t", "p"):
+        data = (FIXTURES / f"chain.run1.{ext}").read_bytes()
+        (tmp_path / f"chain.run1.{ext}").write_bytes(data)
+    trace.poll()
+
+    full = RunTrace(FIXTURES / "chain.run1")
+    full.poll()
+    assert len(trace) == len(full) == 80
+    assert trace.splits == full.splits
+    assert trace.values == full.values
+    assert trace.generations == list(range(0, 8000, 100))
+
+
+def test_ess_matches_direct_geyer_on_fixture():
+    trace = RunTrace(FIXTURES / "chain.run1")
+    trace.poll()
+    values = np.asarray(trace.values)
+    for j in range(values.shape[1]):
+        assert effective_sample_size(values[:, j]) == pytest.approx(naive_ess(values[:, j]))
+
+
+def test_ess_of_known_processes():
+    rng = random.Random(5)
+    n = 5000
+    iid = [rng.gauss(0, 1) for _ in range(n)]
+    assert effective_sample_size(iid) == pytest.approx(n, rel=0.15)
+    ar = [0.0]
+    for _ in range(n - 1):
+        ar.append(0.9 * ar[-1] + rng.gauss(0, 1))
+    # The ESS of an AR(1) process is n (1 - phi) / (1 + phi)
+    assert effective_sample_size(ar) == pytest.approx(n * 0.1 / 1.9, rel=0.3)
+    assert effective_sample_size([2.0] * 10) == float("inf")
+    assert effective_sample_size([1.0, 2.0, 3.0]) == 0.0
+
+
+def test_monitor_stops_where_the_criteria_first_hold():
+    thresholds = Thresholds(max_asdsf=0.1, min_ess=10, consecutive=5, ess_interval=1)
+    expected = naive_stop(FIXTURES / "chain", 2, 0.25, thresholds)
+    assert expected is not None
+    m = SampleMonitor(FIXTURES / "chain", nruns=2, burninfrac=0.25, thresholds=thresholds)
+    assert m.poll() == expected
+
+
+def test_ess_is_only_recomputed_every_interval(monkeypatch):
+    calls = []
+    original = SampleMonitor.min_ess
+
+    def counting_min_ess(self):
+        calls.append(self.checked)
+        return original(self)
+
+    monkeypatch.setattr(SampleMonitor, "min_ess", counting_min_ess)
+    thresholds = Thresholds(max_asdsf=1.0, min_ess=1e9, ess_interval=10)
+    m = SampleMonitor(FIXTURES / "chain", nruns=2, burninfrac=0.25, thresholds=thresholds)
+    m.poll()
+    assert m.checked == 80
+    assert all(b - a >= 10 for a, b in zip(calls, calls[1:]))
+    assert len(calls) <= 8
+
+
+def test_truncate_run(tmp_path):
+    for ext in ("t", "p"):
+        shutil.copy(FIXTURES / f"chain.run1.{ext}", tmp_path / f"chain.run1.{ext}")
+    truncate_run(tmp_path / "chain.run1", 3000)
+
+    p_lines = (tmp_path / "chain.run1.p").read_text().splitlines()
+    assert p_lines[:2] == ["[ID: 9409050143]", "Gen\tLnL\tTL"]
+    assert [int(line.split()[0]) for line in p_lines[2:]] == list(range(0, 3001, 100))
+
+    t_text = (tmp_path / "chain.run1.t").read_text()
+    assert t_text.startswith((FIXTURES / "chain.run1.t").read_text()[:100])
+    tree_lines = [line for line in t_text.splitlines() if line.strip().startswith("tree ")]
+    assert tree_lines[-1].strip().startswith("tree gen.3000 ")
+    assert t_text.count("end;") == 1 and t_text.endswith(";\nend;\n")
+    trace = RunTrace(tmp_path / "chain.run1")
+    trace.poll()
+    assert trace.generations == list(range(0, 3001, 100))
+    assert len(trace) == 31
+
+
+def test_truncate_run_after_the_end_keeps_everything(tmp_path):
+    for ext in ("t", "p"):
+        shutil.copy(FIXTURES / f"chain.run1.{ext}", tmp_path / f"chain.run1.{ext}")
+    truncate_run(tmp_path / "chain.run1", 10**6)
+    for ext in ("t", "p"):
+        assert (tmp_path / f"chain.run1.{ext}").read_text() == (
+            FIXTURES / f"chain.run1.{ext}"
+        ).read_text()
+
+
+def test_thresholds_from_meta():
+    thresholds = Thresholds.from_meta({"monitor.min_ess": "50", "monitor.ess_interval": 3})
+    assert thresholds.min_ess == 50.0
+    assert thresholds.ess_interval == 3
+    assert thresholds.max_asdsf == monitor.Thresholds().max_asdsf
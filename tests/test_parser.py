@@ -0,0 +1,37 @@
+import json
+from pathlib import Path
+import shutil
+
+import parser
+from resultstore import ResultStore
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def write_results(folder):
+    folder.mkdir()
+    parameters_json = folder / "parameters.json"
+    parameters_json.write_text(json.dumps({"inputs": ["samp_1.fasta"], "mcmc.burninfrac": 0.0}))
+    for r in (1, 2):
+        shutil.copy(FIXTURES / f"halves.run{r}.t", folder / f"samp_1_conv.nexus.run{r}.t")
+    shutil.copy(FIXTURES / "halves.galax.txt", folder / "samp1merged.txt")
+    return parameters_json
+
+
+def test_native_estimates_are_kept_apart_from_galax_values(tmp_path):
+    parameters_json = write_results(tmp_path / "f")
+
+    [galax_row] = parser.process_parameter(parameters_json)
+    assert galax_row["galax_information"] == 48.81405
+    assert "native_information" not in galax_row
+    assert galax_row["information_source"] == "galax"
+
+    [native_row] = parser.process_parameter(parameters_json, native=True)
+    assert "galax_information" not in native_row
+    assert abs(native_row["native_information"] - 48.81405) < 1e-5
+    assert native_row["information_source"] == parser.ESTIMATOR
+
+    with ResultStore(tmp_path / "results.sqlite") as store:
+        store.upsert(parameters_json, [native_row], parser.galax_stats(parameters_json, True))
+        assert store.db.execute("SELECT galax_information FROM results").fetchall() == [(None,)]
+        assert store.query() == [native_row]
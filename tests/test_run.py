@@ -0,0 +1,68 @@
+import json
+
+import run
+
+
+def test_monitor_state_is_kept_out_of_parameters(tmp_path, fake_mb, make_folder):
+    folder = tmp_path / "f"
+    make_folder(folder, **{"monitor.consecutive": 3, "monitor.ess_interval": 1})
+    parameters = (folder / "parameters.json").read_text()
+
+    assert run.run(folder, mb=fake_mb, monitor=True, poll_interval=0.05) == 0
+
+    # The fake runs agree on one topology and have constant traces, so a sample
+    # converges at the third sample with an ESS, the one of generation 500. Whether
+    # the fake has already finished the second sample by then depends on timing
+    stopped_at = run.read_stopped_at(folder)
+    assert stopped_at["samp_1_conv.nexus"] == 500
+    assert set(stopped_at.values()) == {500}
+    p_lines = (folder / "samp_1_conv.nexus.run1.p").read_text().splitlines()
+    assert p_lines[-1].split()[0] == "500"
+    assert (folder / "parameters.json").read_text() == parameters
+    meta = json.loads(parameters)
+    assert [status for _, status in run.pending_samples(folder, meta)] == []
+
+    # Starting over forgets where the monitor stopped
+    assert run.run(folder, mb=fake_mb, force=True) == 0
+    assert run.read_stopped_at(folder) == {}
+
+
+def test_starting_over_discards_outputs_of_earlier_inputs(tmp_path, fake_mb, make_folder):
+    folder = tmp_path / "f"
+    make_folder(folder, nsamples=3)
+    assert run.run(folder, mb=fake_mb) == 0
+
+    # New inputs, and the run starting over on them is interrupted in sample 2
+    with open(folder / "samp_1_conv.nexus", "a") as nexus:
+        nexus.write("[changed]\n")
+    (folder / "interrupt").touch()
+    assert run.run(folder, mb=fake_mb) == 1
+    assert not (folder / "samp_3_conv.nexus.run1.t").exists()
+
+    assert run.run(folder, mb=fake_mb) == 0
+    resume = (folder / "resume.nexus").read_text()
+    assert "samp_1_conv.nexus" not in resume
+    assert "execute samp_2_conv.nexus;" in resume
+    assert "execute samp_3_conv.nexus;" in resume
+
+
+def test_monitored_restart_reruns_samples_with_outputs_of_an_earlier_run(
+    tmp_path, fake_mb, make_folder, monkeypatch
+):
+    folder = tmp_path / "f"
+    make_folder(folder, **{"monitor.consecutive": 3, "monitor.ess_interval": 1})
+    assert run.run(folder, mb=fake_mb) == 0
+    for r in (1, 2):
+        p_path = folder / f"samp_2_conv.nexus.run{r}.p"
+        p_path.write_text(p_path.read_text().replace("-100.0", "-999.0"))
+
+    # mb is still in its pause after sample 1 when the monitor stops it there
+    monkeypatch.setenv("FAKE_MB_SAMPLE_SLEEP", "2")
+    assert run.run(folder, mb=fake_mb, force=True, monitor=True, poll_interval=0.05) == 0
+    assert (folder / "mb_calls.txt").read_text().split() == [
+        "mbblock.nexus",
+        "mbblock.nexus",
+        "resume.nexus",
+    ]
+    assert "-999.0" not in (folder / "samp_2_conv.nexus.run1.p").read_text()
+    assert run.read_stopped_at(folder) == {"samp_1_conv.nexus": 500, "samp_2_conv.nexus": 500}
@@ -0,0 +1,118 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import run
+import schedule
+
+
+def read_log(path):
+    return [line.split() for line in path.read_text().splitlines()]
+
+
+def test_schedule_keeps_within_cores(tmp_path, fake_mb, make_folder, monkeypatch):
+    log = tmp_path / "mb_times.txt"
+    monkeypatch.setenv("FAKE_MB_LOG", str(log))
+    monkeypatch.setenv("FAKE_MB_SLEEP", "0.3")
+    for i in range(4):
+        make_folder(tmp_path / "exp" / f"f{i}")
+
+    jobs = schedule.find_jobs(tmp_path / "exp", 4)
+    assert [job.cores for job in jobs] == [2, 2, 2, 2]
+    results = schedule.schedule(jobs, 4, mb=fake_mb)
+
+    assert sorted(r.returncode for r in results) == [0, 0, 0, 0]
+    times = [(float(start), float(end)) for _, start, end in read_log(log)]
+    assert len(times) == 4
+    # Two 2-core jobs at most share the 4 cores at any time
+    for start, _ in times:
+        assert sum(1 for s, e in times if s <= start < e) <= 2
+    for job in jobs:
+        meta = run.read_meta(job.folder)
+        assert all((job.folder / f).exists() for f in run.mb_outputs(meta))
+
+
+def test_schedule_rejects_jobs_larger_than_the_machine(tmp_path, fake_mb, make_folder):
+    make_folder(tmp_path / "f")
+    with pytest.raises(ValueError, match="needs 8 cores"):
+        schedule.schedule([schedule.Job(folder=tmp_path / "f", cores=8)], 4, mb=fake_mb)
+
+
+def test_a_broken_folder_fails_without_stopping_the_others(tmp_path, fake_mb, make_folder):
+    make_folder(tmp_path / "good")
+    make_folder(tmp_path / "broken")
+    meta = json.loads((tmp_path / "broken" / "parameters.json").read_text())
+    meta["inputs"] = ["samp_1.txt"]
+    (tmp_path / "broken" / "parameters.json").write_text(json.dumps(meta))
+
+    jobs = schedule.find_jobs(tmp_path, 4)
+    results = {Path(r.folder).name: r for r in schedule.schedule(jobs, 2, mb=fake_mb)}
+    assert results["good"].returncode == 0
+    assert results["broken"].returncode is None
+    assert "AssertionError" in Path(results["broken"].log).read_text()
+
+
+def test_find_jobs_clamps_to_total_cores(tmp_path, make_folder):
+    make_folder(tmp_path / "f", **{"mcmc.nchains": 4})
+    assert [job.cores for job in schedule.find_jobs(tmp_path, 4)] == [4]
+
+
+def test_find_jobs_books_cores_for_every_shard(tmp_path, make_folder):
+    make_folder(tmp_path / "one", nsamples=3)
+    make_folder(tmp_path / "two", nsamples=3, **{"mb.shards": 2})
+    make_folder(tmp_path / "each", nsamples=3, **{"mb.shards": "sample"})
+    make_folder(tmp_path / "many", nsamples=3, **{"mb.shards": 5})
+    jobs = {job.folder.name: job.cores for job in schedule.find_jobs(tmp_path, 8)}
+    assert jobs == {"one": 2, "two": 4, "each": 6, "many": 6}
+    assert schedule.find_jobs(tmp_path / "each", 4)[0].cores == 4
+
+
+def test_shards_only_run_concurrently_within_the_booked_cores(
+    tmp_path, fake_mb, make_folder, monkeypatch
+):
+    log = tmp_path / "mb_times.txt"
+    monkeypatch.setenv("FAKE_MB_LOG", str(log))
+    monkeypatch.setenv("FAKE_MB_SLEEP", "0.3")
+    folder = tmp_path / "f"
+    make_folder(folder, nsamples=4, **{"mb.shards": "sample"})
+
+    # Four shards of two chains each take turns on four cores
+    [job] = schedule.find_jobs(tmp_path, 4)
+    assert job.cores == 4
+    [result] = schedule.schedule([job], 4, mb=fake_mb)
+    assert result.returncode == 0
+    times = [(float(start), float(end)) for _, start, end in read_log(log)]
+    assert len(times) == 4
+    assert max(sum(1 for s, e in times if s <= start < e) for start, _ in times) == 2
+    assert sorted((folder / "mb_calls.txt").read_text().split()) == [
+        run.shard_block(k) for k in range(1, 5)
+    ]
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path, fake_mb, make_folder):
+    folder = tmp_path / "f"
+    make_folder(folder)
+    (folder / "interrupt").touch()
+
+    [result] = schedule.schedule([schedule.Job(folder=folder, cores=2)], 2, mb=fake_mb)
+    assert result.returncode == 1
+    assert (folder / "samp_2_conv.nexus.ckp").exists()
+
+    [result] = schedule.schedule([schedule.Job(folder=folder, cores=2)], 2, mb=fake_mb)
+    assert result.returncode == 0
+    assert (folder / "mb_calls.txt").read_text().split() == ["mbblock.nexus", "resume.nexus"]
+    resume = (folder / "resume.nexus").read_text()
+    # The finished sample is skipped, the interrupted one continues from its checkpoint
+    assert "samp_1_conv.nexus" not in resume
+    assert "execute samp_2_conv.nexus;" in resume
+    assert "append=yes" in resume
+    meta = json.loads((folder / "parameters.json").read_text())
+    assert all(
+        run.sample_status(folder, name, meta) == run.FINISHED
+        for name in run.sample_files(meta)[1]
+    )
+
+    # Nothing is left to run
+    assert run.run(folder, mb=fake_mb) == 0
+    assert len((folder / "mb_calls.txt").read_text().split()) == 2
@@ -0,0 +1,33 @@
+import json
+import threading
+
+import tracing
+
+
+def test_threads_nest_their_spans_separately(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "trace.json")
+    nthreads = 4
+    both_open = threading.Barrier(nthreads)
+    stacks = {}
+
+    def shard(i):
+        with tracer.span(f"shard {i}"):
+            with tracer.span(f"mb {i}"):
+                both_open.wait()
+                stacks[i] = list(tracer.stack)
+                both_open.wait()
+
+    threads = [threading.Thread(target=shard, args=(i,)) for i in range(nthreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stacks == {i: [f"shard {i}", f"mb {i}"] for i in range(nthreads)}
+    assert tracer.stack == []
+    summary = tracer.finish()
+    assert sorted(t["name"] for t in summary) == sorted(
+        f"{kind} {i}" for kind in ("shard", "mb") for i in range(nthreads)
+    )
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert len(events) == 2 * nthreads
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import resource
+import subprocess
+import threading
+import time
+from typing import Optional
+
+# The active tracer of this process, or None if tracing is off
+TRACER = None
+
+
+def _io_counters(pid="self"):
+    """Bytes read and written by a process (rchar/wchar), or (0, 0) where /proc has no io file."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events. Each span records its wall
+    time, the CPU time of the process and its waited-for children, the
+    process' peak RSS so far and the bytes it read and wrote. Spans of
+    forked worker processes are appended to ``<path>.parts/<pid>.jsonl``
+    whenever they have no open span left, and ``finish`` merges them.
+    Threads, such as the ones running mb shards, nest their spans
+    separately and may close them concurrently.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.parts = self.path.with_name(self.path.name + ".parts")
+        self.parts.mkdir(parents=True, exist_ok=True)
+        self.origin = time.time()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.local = threading.local()
+        # Guards events and the part file, which all threads share
+        self.lock = threading.Lock()
+        self.events = []
+
+    @property
+    def stack(self):
+        """Names of the spans open in the calling thread, innermost last."""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def _timestamp(self) -> float:
+        return (time.time() - self.origin) * 1e6
+
+    def add_event(self, name, start_ts, duration, args):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start_ts,
+            "dur": duration,
+            "pid": self.pid,
+            "tid": threading.get_native_id(),
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, **args):
+        start_ts = self._timestamp()
+        start_wall = time.perf_counter()
+        start_cpu = _cpu_time()
+        start_read, start_written = _io_counters()
+        self.stack.append(name)
+        try:
+            yield args
+        finally:
+            self.stack.pop()
+            read, written = _io_counters()
+            args.update(
+                wall_time=time.perf_counter() - start_wall,
+                cpu_time=_cpu_time() - start_cpu,
+                max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                bytes_read=read - start_read,
+                bytes_written=written - start_written,
+            )
+            self.add_event(name, start_ts, args["wall_time"] * 1e6, args)
+            if not self.stack:
+                self.flush()
+
+    def wait(self, process: subprocess.Popen, name) -> int:
+        """
+        Wait for a child like ``process.wait()`` and record it as a span,
+        with the CPU time and peak RSS from its rusage and its I/O read
+        from /proc before it is reaped. Linux counts the child's peak RSS
+        from the memory of this process at the fork, so small children
+        show at least that.
+        """
+        start_ts = getattr(process, "trace_started", self._timestamp())
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        read, written = _io_counters(process.pid)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = (self._timestamp() - start_ts) / 1e6
+        self.add_event(
+            name,
+            start_ts,
+            wall_time * 1e6,
+            {
+                "argv": [str(a) for a in process.args],
+                "returncode": process.returncode,
+                "wall_time": wall_time,
+                "cpu_time": usage.ru_utime + usage.ru_stime,
+                "max_rss": usage.ru_maxrss,
+                "bytes_read": read,
+                "bytes_written": written,
+            },
+        )
+        return process.returncode
+
+    def flush(self):
+        with self.lock:
+            if not self.events:
+                return
+            with open(self.parts / f"{self.pid}.jsonl", "a") as part:
+                part.writelines(json.dumps(event) + "\n" for event in self.events)
+            self.events = []
+
+    def finish(self):
+        """Merge the spans of all processes into the trace file and return them."""
+        self.flush()
+        events = []
+        for part in sorted(self.parts.iterdir()):
+            with open(part) as f:
+                events.extend(json.loads(line) for line in f)
+            part.unlink()
+        self.parts.rmdir()
+        events.sort(key=lambda e: e["ts"])
+        summary = summarize(events)
+        self.path.write_text(
+            json.dumps(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"summary": summary},
+                }
+            ),
+            encoding="utf-8",
+        )
+        return summary
+
+
+def summarize(events):
+    """Totals per span name, largest total wall time first."""
+    totals = defaultdict(
+        lambda: {
+            "count": 0,
+            "wall_time": 0.0,
+            "cpu_time": 0.0,
+            "max_rss": 0,
+            "bytes_read": 0,
+            "bytes_written": 0,
+        }
+    )
+    for event in events:
+        total = totals[event["name"]]
+        args = event["args"]
+        total["count"] += 1
+        total["wall_time"] += args["wall_time"]
+        total["cpu_time"] += args["cpu_time"]
+        total["max_rss"] = max(total["max_rss"], args["max_rss"])
+        total["bytes_read"] += args["bytes_read"]
+        total["bytes_written"] += args["bytes_written"]
+    return sorted(
+        ({"name": name, **total} for name, total in totals.items()),
+        key=lambda t: t["wall_time"],
+        reverse=True,
+    )
+
+
+def format_summary(summary) -> str:
+    lines = [
+        f"{'span':<28}{'count':>8}{'wall s':>12}{'cpu s':>12}"
+        f"{'peak MiB':>10}{'read MiB':>11}{'write MiB':>11}"
+    ]
+    for t in summary:
+        lines.append(
+            f"{t['name'][:28]:<28}{t['count']:>8}{t['wall_time']:>12.3f}{t['cpu_time']:>12.3f}"
+            f"{t['max_rss'] / 1024:>10.1f}{t['bytes_read'] / 2**20:>11.1f}"
+            f"{t['bytes_written'] / 2**20:>11.1f}"
+        )
+    return "\n".join(lines)
+
+
+# Forked workers start without the open spans and unflushed events of their parent
+def _after_fork_in_child():
+    if TRACER is not None:
+        TRACER._reset()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def enable(path) -> Tracer:
+    global TRACER
+    TRACER = Tracer(path)
+    return TRACER
+
+
+def finish() -> Optional[list]:
+    """Write the trace file, print the summary table and turn tracing off."""
+    global TRACER
+    if TRACER is None:
+        return None
+    tracer, TRACER = TRACER, None
+    summary = tracer.finish()
+    print(format_summary(summary))
+    print(f"Trace written to {tracer.path}.")
+    return summary
+
+
+@contextmanager
+def span(name, **args):
+    """Record the enclosed block as a span if tracing is on."""
+    if TRACER is None:
+        yield args
+        return
+    with TRACER.span(name, **args) as span_args:
+        yield span_args
+
+
+def call(args, **kwargs) -> int:
+    """``subprocess.call`` that records the child as an ``exec <program>`` span."""
+    if TRACER is None:
+        return subprocess.call(args, **kwargs)
+    process = subprocess.Popen(args, **kwargs)
+    process.trace_started = TRACER._timestamp()
+    try:
+        return TRACER.wait(process, f"exec {Path(str(args[0])).name}")
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+
+def check_call(args, **kwargs):
+    returncode = call(args, **kwargs)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args)
+    return 0
@@ -1,6 +1,58 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tempfile
+
+from fastaio import append_file, map_file
+
+
+# Converts each "<header><delimiter><sequence>" line of buf[start:end] into a FASTA record
+def convert(buf, delimiter, out, start=0, end=None, header_column=0, sequence_column=1):
+    end = len(buf) if end is None else end
+    maxsplit = max(header_column, sequence_column) + 1
+    pos = start
+    while pos < end:
+        eol = buf.find(b"\n", pos, end)
+        if eol < 0:
+            eol = end
+        line = buf[pos:eol].rstrip(b"\r")
+        line_start = pos
+        pos = eol + 1
+        if not line:
+            continue
+
+        # Split strings on user-defined character
+        splice = line.split(delimiter, maxsplit)
+        if len(splice) < maxsplit:
+            raise ValueError(
+                f"Line at byte {line_start} has {len(splice)} column(s), expected at least {maxsplit}."
+            )
+
+        # Output the header and the sequence in one write
+        out.write(b"> " + splice[header_column] + b"\n" + splice[sequence_column] + b"\n")
+
+
+# Splits buf[start:] into about `count` byte ranges that each end on a line boundary
+def newline_aligned_ranges(buf, start, count):
+    size = len(buf)
+    bounds = [start]
+    for k in range(1, count):
+        nl = buf.find(b"\n", max(bounds[-1], start + (size - start) * k // count))
+        if nl < 0:
+            break
+        bounds.append(nl + 1)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+# Worker: converts one byte range of the input into its own temporary file
+def convert_chunk(infile, tmpdir, delimiter, start, end, header_column, sequence_column):
+    fd, tmp_path = tempfile.mkstemp(dir=tmpdir, suffix=".fasta.part")
+    with map_file(infile) as buf, open(fd, "wb") as out:
+        convert(buf, delimiter, out, start, end, header_column, sequence_column)
+    return tmp_path
 
 
 def main():
@@ -15,22 +67,61 @@ def main():
         help="Type of delimiter inside text files. , or \t are common examples.",
         required=True,
     )
+    ap.add_argument(
+        "--header-column",
+        type=int,
+        default=0,
+        help="Zero-based index of the column holding the FASTA header. Default = 0",
+    )
+    ap.add_argument(
+        "--sequence-column",
+        type=int,
+        default=1,
+        help="Zero-based index of the column holding the sequence. Default = 1",
+    )
+    ap.add_argument(
+        "--skip-header",
+        action="store_true",
+        help="Skip the first line of the input file, e.g. a row of column names.",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes. With more than one, the input is split into newline-aligned byte ranges that are converted in parallel and concatenated in order. Default = 1",
+    )
     A = ap.parse_args()
 
-    FileOutput = open(ap.outfile, "w")
+    delimiter = A.delimiter.encode("utf-8")
+    columns = (A.header_column, A.sequence_column)
 
-    with open(ap.infile, "r") as FileInput:
-        print("Converting to FASTA...")
-        for strLine in FileInput:
+    print("Converting to FASTA...")
+    with map_file(A.infile) as FileInput:
+        start = 0
+        if A.skip_header:
+            nl = FileInput.find(b"\n")
+            start = len(FileInput) if nl < 0 else nl + 1
+        ranges = newline_aligned_ranges(FileInput, start, max(1, A.jobs) * 4)
 
-            # Split strings on user-defined character
-            splice = strLine.split(str(a.delimiter))
+        if A.jobs <= 1 or len(ranges) <= 1:
+            with open(A.outfile, "wb") as FileOutput:
+                convert(FileInput, delimiter, FileOutput, start, None, *columns)
+            print("Done.")
+            return
 
-            # Output the header
-            FileOutput.write("> " + splice[0])
-            FileOutput.write("\n" + splice[1])
+    outdir = Path(A.outfile).resolve().parent
+    with tempfile.TemporaryDirectory(dir=outdir) as tmpdir:
+        with ProcessPoolExecutor(max_workers=A.jobs) as pool:
+            futures = [
+                pool.submit(convert_chunk, A.infile, tmpdir, delimiter, a, b, *columns)
+                for a, b in ranges
+            ]
+            parts = [f.result() for f in futures]
+        with open(A.outfile, "wb") as FileOutput:
+            for part in parts:
+                append_file(part, FileOutput)
 
-    FileOutput.close()
     print("Done.")
 
 